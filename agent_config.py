@@ -0,0 +1,42 @@
+# Loads the list of agents from a JSON config file (see agents.json)
+# Each agent needs a name, agent_id, system_prompt and tts_voice. filter_name and tts_model are optional.
+# options (Ollama generation options, e.g. num_predict or stop) and max_sentences are optional too.
+# Set at the top level, they apply to every agent, and an agent's own options are merged on top.
+# system_prompt can be the name of a prompt in the prompts/ folder (e.g. "VIDEOGAME_AGENT_1"), or the prompt text itself.
+import json
+import importlib
+
+PROMPT_MODULES = [
+    "prompts.ai_prompts",
+    "prompts.ai_prompts_generic",
+    "prompts.ai_prompts_murder_mystery",
+    "prompts.ai_prompts_cold_boot",
+]
+
+def resolve_prompt(prompt):
+    # Returns a {"role": "system", "content": ...} dict, like the ones defined in the prompts/ files
+    for module_name in PROMPT_MODULES:
+        module = importlib.import_module(module_name)
+        if isinstance(prompt, str) and hasattr(module, prompt):
+            return getattr(module, prompt)
+    return {"role": "system", "content": prompt}
+
+def load_agent_configs(path="agents.json"):
+    with open(path, "r", encoding="utf-8") as file:
+        config = json.load(file)
+    default_tts_model = config.get("tts_model", "tts_models/en/vctk/vits")
+    default_options = config.get("options", {})
+    default_max_sentences = config.get("max_sentences")
+    agent_configs = []
+    for i, agent in enumerate(config["agents"]):
+        agent_configs.append({
+            "name": agent["name"],
+            "agent_id": agent.get("agent_id", i + 1),
+            "filter_name": agent.get("filter_name", ""),
+            "system_prompt": resolve_prompt(agent["system_prompt"]),
+            "tts_voice": agent.get("tts_voice"),
+            "tts_model": agent.get("tts_model", default_tts_model),
+            "options": {**default_options, **agent.get("options", {})},
+            "max_sentences": agent.get("max_sentences", default_max_sentences),
+        })
+    return agent_configs
@@ -0,0 +1,152 @@
+# AgentContext: Keeps an agent's prompt under a token budget during long sessions
+# The system prompt is always kept, the most recent messages are kept word for word, and older messages
+# are folded into a running summary by a background thread, so the agent never waits on summarization before talking.
+# Every message's token count is calculated once when it's added, so checking the budget is O(1) per message.
+import threading
+from collections import deque
+from rich import print
+
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+
+def estimate_tokens(text):
+    # Rough count that works for any model: about 4 characters per token, plus a little overhead per message
+    return len(text) // 4 + 4
+
+def summary_prompt(name, previous_summary, messages):
+    # The prompt that asks the LLM to fold messages into an agent's running summary. Used by every runtime, so agents summarize the same way.
+    lines = []
+    for msg in messages:
+        if msg["role"] == "assistant":
+            lines.append(f"[{name}] {msg['content']}")
+        else:
+            lines.append(str(msg["content"]))
+    return ("You are keeping notes on a conversation for one of its participants, "
+            f"{name}. Update the summary below with the new messages. Keep who said what, "
+            "important facts, opinions and running jokes. Reply with only the updated summary, in 200 words or less.\n\n"
+            f"Current summary:\n{previous_summary or '(none yet)'}\n\n"
+            "New messages:\n" + '\n'.join(lines))
+
+def get_token_counter():
+    # Use tiktoken if it's installed. It's not the same tokenizer as the local model, but it's much closer than guessing.
+    try:
+        import tiktoken
+        encoder = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoder.encode(text)) + 4
+    except Exception:
+        return estimate_tokens
+
+
+class AgentContext:
+    """
+    Parameters:
+    system_prompt (str): pinned at the top of every prompt, never summarized
+    token_budget (int): max tokens for system prompt + summary + recent messages
+    keep_recent (int): the newest messages that are always kept word for word, even if that means going over budget
+    summarize (callable): summarize(previous_summary, messages) -> new summary string. If None, old messages are just dropped.
+    count_tokens (callable): counts the tokens in a string
+    low_water (float): once over budget, fold messages until we're under this fraction of the budget,
+                       so summaries happen in batches instead of on every single message
+    """
+
+    def __init__(self, system_prompt, token_budget=6000, keep_recent=12, summarize=None, count_tokens=None, low_water=0.75, name="agent"):
+        self.count_tokens = count_tokens or get_token_counter()
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.system_tokens = self.count_tokens(system_prompt)
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summarize = summarize
+        self.low_water = low_water
+        self.name = name
+        self.summary = ""
+        self.summary_tokens = 0
+        self.recent = deque()  # (message, token_count) pairs
+        self.recent_tokens = 0
+        self.to_fold = []  # messages that left the window but haven't been summarized yet
+        self.lock = threading.Lock()
+        self.summarizer_thread = None
+
+    @property
+    def total_tokens(self):
+        return self.system_tokens + self.summary_tokens + self.recent_tokens
+
+    def append(self, message, tokens=None):
+        # tokens: the message's token count, if it's already known (e.g. from the MessageStore), so it isn't counted again
+        if tokens is None:
+            tokens = self.count_tokens(str(message["content"]))
+        with self.lock:
+            self.recent.append((message, tokens))
+            self.recent_tokens += tokens
+            if self.total_tokens > self.token_budget:
+                self._evict()
+
+    def restore(self, messages):
+        # Refills the context from a saved conversation: messages is a list of (message, tokens), oldest first.
+        # Keeps the newest ones that fit the budget (and at least keep_recent), without summarizing the rest,
+        # so resuming doesn't send a pile of summary requests to the LLM. Returns how many were left out.
+        with self.lock:
+            kept = []
+            tokens = self.system_tokens + self.summary_tokens + self.recent_tokens
+            for message, message_tokens in reversed(messages):
+                if tokens + message_tokens > self.token_budget * self.low_water and len(kept) >= self.keep_recent:
+                    break
+                kept.append((message, message_tokens))
+                tokens += message_tokens
+            for message, message_tokens in reversed(kept):
+                self.recent.append((message, message_tokens))
+                self.recent_tokens += message_tokens
+            return len(messages) - len(kept)
+
+    @property
+    def recent_count(self):
+        # How many of the newest messages are in the prompt word for word
+        return len(self.recent)
+
+    def messages(self):
+        # The message list to send to the LLM: system prompt, summary (if any), then recent messages
+        with self.lock:
+            messages = [self.system_message]
+            if self.summary:
+                messages.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+            messages.extend(message for message, _ in self.recent)
+            return messages
+
+    def _evict(self):
+        # Called with the lock held. Moves the oldest messages out of the window until we're back under the low water mark.
+        target = self.token_budget * self.low_water
+        evicted = False
+        while self.total_tokens > target and len(self.recent) > self.keep_recent:
+            message, tokens = self.recent.popleft()
+            self.recent_tokens -= tokens
+            self.to_fold.append(message)
+            evicted = True
+        if not evicted:
+            return
+        if self.summarize is None:
+            self.to_fold = []
+            return
+        if self.summarizer_thread is None or not self.summarizer_thread.is_alive():
+            self.summarizer_thread = threading.Thread(target=self._summarize_loop, daemon=True)
+            self.summarizer_thread.start()
+
+    def _summarize_loop(self):
+        # Runs until there's nothing left to fold. Messages evicted while a summary is being written get picked up on the next loop.
+        while True:
+            with self.lock:
+                if not self.to_fold:
+                    self.summarizer_thread = None
+                    return
+                batch, self.to_fold = self.to_fold, []
+                previous_summary = self.summary
+            try:
+                new_summary = self.summarize(previous_summary, batch).strip()
+            except Exception as e:
+                # Put the batch back, so it gets folded in with the next eviction instead of being lost
+                with self.lock:
+                    self.to_fold = batch + self.to_fold
+                    self.summarizer_thread = None
+                print(f"[red]({self.name}) Could not summarize {len(batch)} older messages, will retry on the next eviction: {e}")
+                return
+            with self.lock:
+                self.summary = new_summary
+                self.summary_tokens = self.count_tokens(new_summary) if new_summary else 0
+            print(f"[grey]({self.name}) Folded {len(batch)} older messages into the summary ({self.total_tokens} tokens in context).")
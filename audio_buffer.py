@@ -0,0 +1,54 @@
+# AudioBuffer: PCM audio kept in memory as a NumPy array, so TTS output can go straight to the speakers without touching the disk
+import numpy as np
+
+class AudioBuffer:
+    """
+    samples: float32 NumPy array in the range [-1, 1], shape (frames,) for mono or (frames, channels)
+    sample_rate: samples per second
+    """
+
+    def __init__(self, samples, sample_rate):
+        self.samples = np.asarray(samples, dtype=np.float32)
+        self.sample_rate = int(sample_rate)
+
+    @property
+    def frames(self):
+        return self.samples.shape[0]
+
+    @property
+    def channels(self):
+        return 1 if self.samples.ndim == 1 else self.samples.shape[1]
+
+    @property
+    def duration(self):
+        # Length in seconds
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    def to_int16(self):
+        return (np.clip(self.samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+    @classmethod
+    def from_int16(cls, samples, sample_rate):
+        return cls(np.asarray(samples, dtype=np.float32) / 32768.0, sample_rate)
+
+    def write(self, file_path):
+        # Optional archival sink, e.g. to keep a copy of everything the agents said
+        import soundfile as sf
+        sf.write(file_path, self.samples, self.sample_rate)
+        return file_path
+
+    def resampled(self, target_rate):
+        # Band-limited resample (see audio_normalize.py)
+        if target_rate == self.sample_rate or self.frames == 0:
+            return self
+        from audio_normalize import resample
+        return AudioBuffer(resample(self.samples, self.sample_rate, target_rate), target_rate)
+
+    def with_channels(self, channels):
+        # Mono -> stereo duplicates the channel, stereo -> mono averages them
+        if channels == self.channels:
+            return self
+        mono = self.samples if self.channels == 1 else self.samples.mean(axis=1)
+        if channels == 1:
+            return AudioBuffer(mono, self.sample_rate)
+        return AudioBuffer(np.repeat(mono.reshape(-1, 1), channels, axis=1), self.sample_rate)
@@ -0,0 +1,126 @@
+# AudioNormalizer: Converts any clip into the output stream's format (48 kHz stereo int16 by default) inside this process
+# Replaces shelling out to ffmpeg for every wav pygame couldn't load: no process spawn, no re-encode, no shared temp file.
+# Converted clips are cached by a digest of the source (the file's bytes, or the samples of an in-memory clip),
+# so replaying the same file or TTS clip skips decoding and resampling entirely.
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from math import gcd
+import numpy as np
+from audio_buffer import AudioBuffer
+
+_filters = {}
+
+def _polyphase_filter(up, down, taps_per_phase):
+    # Kaiser-windowed sinc lowpass at the lower of the two Nyquist frequencies, split into one row per output phase
+    key = (up, down, taps_per_phase)
+    if key not in _filters:
+        length = taps_per_phase * up
+        cutoff = 1.0 / max(up, down)
+        t = np.arange(length) - length // 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(length, 8.0) * up
+        _filters[key] = np.ascontiguousarray(h.reshape(taps_per_phase, up).T, dtype=np.float32)
+    return _filters[key]
+
+
+def resample(samples, source_rate, target_rate, taps_per_phase=24, block=16384):
+    """
+    Band-limited (polyphase windowed-sinc) resampling, e.g. 22050 Hz TTS output to a 48 kHz stream.
+    samples: float array, shape (frames,) or (frames, channels)
+    Returns float32 samples at target_rate, ceil(frames * target_rate / source_rate) frames long.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if source_rate == target_rate or samples.shape[0] == 0:
+        return samples
+    divisor = gcd(int(source_rate), int(target_rate))
+    up, down = int(target_rate) // divisor, int(source_rate) // divisor
+    phases = _polyphase_filter(up, down, taps_per_phase)
+    out_frames = -(-samples.shape[0] * up // down)
+    offset = (taps_per_phase * up) // 2
+    padded = np.concatenate([np.zeros((taps_per_phase,) + samples.shape[1:], np.float32), samples,
+                             np.zeros((taps_per_phase,) + samples.shape[1:], np.float32)])
+    taps = np.arange(taps_per_phase)
+    output = np.empty((out_frames,) + samples.shape[1:], dtype=np.float32)
+    # In blocks, so the (frames x taps) gather stays a few MB no matter how long the clip is
+    for start in range(0, out_frames, block):
+        positions = np.arange(start, min(start + block, out_frames), dtype=np.int64) * down + offset
+        phase = positions % up
+        inputs = padded[(positions // up)[:, None] - taps + taps_per_phase]  # (n, taps) or (n, taps, channels)
+        if samples.ndim == 1:
+            output[start:start + len(positions)] = np.einsum("nt,nt->n", inputs, phases[phase])
+        else:
+            output[start:start + len(positions)] = np.einsum("ntc,nt->nc", inputs, phases[phase])
+    return output
+
+
+def normalize_pcm(audio_buffer, sample_rate=48000, channels=2):
+    # Returns int16 frames with shape (frames, channels) in the requested format
+    samples = audio_buffer.samples
+    if audio_buffer.channels > channels:
+        samples = audio_buffer.with_channels(channels).samples  # Downmix before resampling, so there's less to resample
+    samples = resample(samples, audio_buffer.sample_rate, sample_rate)
+    converted = AudioBuffer(samples, sample_rate)
+    if converted.channels != channels:
+        converted = converted.with_channels(channels)
+    return converted.to_int16().reshape(-1, channels)
+
+
+class AudioNormalizer:
+    """
+    Parameters:
+    sample_rate (int) / channels (int): the format everything gets converted to
+    cache_bytes (int): memory budget for converted clips, least recently used dropped first. 0 turns the cache off.
+    """
+
+    def __init__(self, sample_rate=48000, channels=2, cache_bytes=64_000_000):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()  # source digest -> int16 frames
+        self.cache_used = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, audio_buffer):
+        # AudioBuffer -> int16 frames in the output format
+        digest = hashlib.blake2b(np.ascontiguousarray(audio_buffer.samples).view(np.uint8), digest_size=16)
+        digest.update(f"{audio_buffer.sample_rate}/{audio_buffer.channels}".encode())
+        return self._cached(digest.hexdigest(), lambda: audio_buffer)
+
+    def load_file(self, file_path):
+        # Any file soundfile can read (wav/flac/ogg, and mp3 with libsndfile 1.1+) -> int16 frames in the output format
+        with open(file_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return self._cached(digest, lambda: self.decode(data, file_path))
+
+    @staticmethod
+    def decode(data, file_path=""):
+        import soundfile as sf
+        try:
+            samples, sample_rate = sf.read(io.BytesIO(data), dtype="float32")
+        except RuntimeError as e:
+            raise ValueError(f"Can't decode audio file {file_path}: {e}") from e
+        return AudioBuffer(samples, sample_rate)
+
+    def _cached(self, digest, load):
+        key = (digest, self.sample_rate, self.channels)
+        with self.lock:
+            pcm = self.cache.get(key)
+            if pcm is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return pcm
+            self.misses += 1
+        pcm = normalize_pcm(load(), self.sample_rate, self.channels)
+        if self.cache_bytes and pcm.nbytes <= self.cache_bytes:
+            with self.lock:
+                if key not in self.cache:
+                    self.cache[key] = pcm
+                    self.cache_used += pcm.nbytes
+                while self.cache_used > self.cache_bytes:
+                    _, evicted = self.cache.popitem(last=False)
+                    self.cache_used -= evicted.nbytes
+        return pcm
@@ -0,0 +1,216 @@
+# AudioOutput: One audio output stream that stays open for the whole session, fed from a PCM ring buffer
+# Agents enqueue their clips into the ring buffer, and the sink (sound card, null or wav file) pulls from it at its own pace.
+# Because the stream never stops, the next clip can be queued while the last one is still finishing, so turns play back to back with no gaps.
+# The sink side never takes a lock (it runs in the sound card's callback, where blocking causes dropouts):
+# the writer only ever moves write_pos and the reader only ever moves read_pos.
+# Writers (there can be several agents) take a writer-only lock so their clips don't interleave.
+# skip() doesn't wait for that lock (a writer holds it until its whole clip is in the ring buffer). It only takes flush_lock,
+# which is held for a single ring write at a time, so a skip from any thread takes effect right away.
+import time
+import wave
+import threading
+import numpy as np
+from rich import print
+from audio_normalize import AudioNormalizer
+
+class PCMRingBuffer:
+    """
+    Single-reader ring buffer of int16 frames.
+    write_pos and read_pos count every frame ever written/read, so they only go up and never need a lock to compare.
+    """
+
+    def __init__(self, capacity_frames, channels):
+        self.capacity = capacity_frames
+        self.channels = channels
+        self.data = np.zeros((capacity_frames, channels), dtype=np.int16)
+        self.write_pos = 0  # Only changed by the writer
+        self.read_pos = 0   # Only changed by the reader
+
+    @property
+    def queued(self):
+        return self.write_pos - self.read_pos
+
+    def write(self, frames):
+        # Copies as many frames as fit and returns how many that was
+        count = min(frames.shape[0], self.capacity - self.queued)
+        if count <= 0:
+            return 0
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:count - first] = frames[first:count]
+        self.write_pos += count
+        return count
+
+    def read_into(self, out):
+        # Fills out with queued frames, pads the rest with silence, and returns how many real frames there were
+        count = min(out.shape[0], self.queued)
+        start = self.read_pos % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:count] = self.data[:count - first]
+        out[count:] = 0
+        self.read_pos += count
+        return count
+
+    def drop_until(self, position):
+        # Reader side: skip everything queued before position (a write_pos captured earlier)
+        if position > self.read_pos:
+            self.read_pos = position
+
+
+class AudioOutput:
+    """
+    Parameters:
+    sink (str): "device" for the sound card (through PyAudio), "null" to play into nothing in real time (headless),
+                or "file:<path>.wav" to record everything that would have played into a wav file
+    sample_rate (int) / channels (int): format of the output stream. Clips are converted to it when they're queued (see audio_normalize.py).
+    buffer_ms (int): size of the ring buffer. A clip longer than this is written in pieces as it plays.
+    block_frames (int): frames per read from the sink (the sound card's buffer size)
+    handoff_ms (int): play() returns when only this much of the clip is left, so whoever speaks next can queue their audio before this one ends
+    """
+
+    def __init__(self, sink="device", sample_rate=48000, channels=2, buffer_ms=2000, block_frames=1024, handoff_ms=60):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.handoff_frames = int(sample_rate * handoff_ms / 1000)
+        self.ring = PCMRingBuffer(int(sample_rate * buffer_ms / 1000), channels)
+        self.normalizer = AudioNormalizer(sample_rate, channels)
+        self.write_lock = threading.Lock()  # Held by a writer for its whole clip
+        self.flush_lock = threading.Lock()  # Held for one ring write, or while skip() marks what to throw away
+        self.generation = 0  # Bumped by skip(), so writers know their clip was thrown away
+        self.flush_pos = 0  # write_pos at the last skip(). The sink drops everything before it, and nothing queued after it.
+        self.closed = False
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.stream = None
+        self.pyaudio = None
+        self.sink_thread = None
+        self.wav_file = None
+
+    def start(self):
+        # Opens the sink. Called automatically by the first play().
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+            if self.sink == "device":
+                try:
+                    self._open_device()
+                    return
+                except Exception as e:
+                    print(f"[yellow]Could not open an audio output device ({e}), playing into a null sink instead.")
+                    self.sink = "null"
+            if self.sink.startswith("file:"):
+                self.wav_file = wave.open(self.sink[len("file:"):], "wb")
+                self.wav_file.setnchannels(self.channels)
+                self.wav_file.setsampwidth(2)
+                self.wav_file.setframerate(self.sample_rate)
+            elif self.sink != "null":
+                raise ValueError(f"Unknown audio sink '{self.sink}', use 'device', 'null' or 'file:<path>.wav'")
+            self.sink_thread = threading.Thread(target=self._clock_loop, name="audio-output", daemon=True)
+            self.sink_thread.start()
+
+    def play(self, audio_buffer, wait=True, skip_requested=None):
+        """
+        Queues an AudioBuffer behind whatever is already playing.
+        wait: block until the clip is (nearly, see handoff_ms) done, otherwise return as soon as it's all in the ring buffer
+        skip_requested: optional function that's polled while waiting, e.g. to check for a skip hotkey. Returning True calls skip().
+        Returns False if the clip was skipped.
+        """
+        return self.play_pcm(self.normalizer.normalize(audio_buffer), wait=wait, skip_requested=skip_requested)
+
+    def play_pcm(self, pcm, wait=True, skip_requested=None):
+        # Same as play(), for int16 frames that are already in the output format (e.g. from normalizer.load_file)
+        self.start()
+        with self.write_lock:
+            generation = self.generation
+            written = 0
+            while written < pcm.shape[0]:
+                if self.generation != generation or self.closed:
+                    return False
+                if skip_requested and skip_requested():
+                    self.skip()
+                    return False
+                with self.flush_lock:
+                    # Checked again under flush_lock, so nothing from a skipped clip is written after skip() has marked the flush
+                    if self.generation != generation:
+                        return False
+                    written += self.ring.write(pcm[written:])
+                if written < pcm.shape[0]:
+                    time.sleep(0.005)
+            end_pos = self.ring.write_pos
+        if not wait:
+            return True
+        while self.ring.read_pos < end_pos - self.handoff_frames:
+            if self.generation != generation or self.closed:
+                return False
+            if skip_requested and skip_requested():
+                self.skip()
+                return False
+            time.sleep(0.01)
+        return self.generation == generation
+
+    def skip(self):
+        # Throws away everything queued, including the rest of the clip that's playing now.
+        # Clips queued after this call still play, even if the sink hasn't caught up with the skip yet.
+        # Doesn't wait for the writer, which notices the new generation before its next write.
+        with self.flush_lock:
+            self.generation += 1
+            self.flush_pos = self.ring.write_pos
+
+    @property
+    def queued_seconds(self):
+        return self.ring.queued / self.sample_rate
+
+    def is_playing(self):
+        return self.ring.queued > 0
+
+    def close(self):
+        self.closed = True
+        if self.sink_thread is not None:
+            self.sink_thread.join(timeout=1)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.pyaudio.terminate()
+        if self.wav_file is not None:
+            self.wav_file.close()
+
+    def read_into(self, out):
+        # Called by the sink for every block. Never blocks.
+        self.ring.drop_until(self.flush_pos)
+        return self.ring.read_into(out)
+
+    def _open_device(self):
+        import pyaudio
+        block = np.zeros((self.block_frames, self.channels), dtype=np.int16)
+
+        def callback(in_data, frame_count, time_info, status):
+            out = block if frame_count == self.block_frames else np.zeros((frame_count, self.channels), dtype=np.int16)
+            self.read_into(out)
+            return (out.tobytes(), pyaudio.paContinue)
+
+        self.pyaudio = pyaudio.PyAudio()
+        self.stream = self.pyaudio.open(format=pyaudio.paInt16, channels=self.channels, rate=self.sample_rate, output=True,
+                                        frames_per_buffer=self.block_frames, stream_callback=callback)
+        self.stream.start_stream()
+
+    def _clock_loop(self):
+        # Null and file sinks: pull one block per block-length of wall time, like a sound card would
+        block = np.zeros((self.block_frames, self.channels), dtype=np.int16)
+        period = self.block_frames / self.sample_rate
+        next_time = time.monotonic()
+        while not self.closed:
+            count = self.read_into(block)
+            if self.wav_file is not None and count:
+                # Only real audio goes into the file, not the silence between clips
+                self.wav_file.writeframes(block[:count].tobytes())
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
@@ -2,15 +2,20 @@ import pygame
 import time
 import os
 import asyncio
-import subprocess
 import threading
 import keyboard
 import wave
 import pyaudio
+import numpy as np
 import soundfile as sf
 from mutagen.mp3 import MP3
 from pydub import AudioSegment
 from rich import print
+from audio_output import AudioOutput
+from audio_normalize import AudioNormalizer, resample
+from vad import VoiceActivityDetector, SpeechEndpointer
+
+WHISPER_SAMPLE_RATE = 16000
 
 class AudioManager:
 
@@ -22,72 +27,83 @@ class AudioManager:
     rate = 44100
     chunk = 1024
 
-    def __init__(self):
-        # Use higher frequency to prevent audio glitching noises
-        # Use higher buffer because why not (default is 512)
-        pygame.mixer.init(frequency=48000, buffer=1024) 
+    def __init__(self, output="device"):
+        """
+        output (str): where played audio goes, see AudioOutput. "device" for the sound card, "null" or "file:<path>.wav" to run headless.
+        """
+        # One output stream for the whole session, so clips from different agents play back to back without gaps
+        self.output = AudioOutput(sink=output)
+        self.skip_key_down = False  # So holding F9 down only counts as one skip
+        self.skip_key_enabled = True  # Turned off for good if the keyboard can't be read
 
     def play_audio(self, file_path, sleep_during_playback=True, delete_file=False, play_using_music=True):
         """
         Parameters:
         file_path (str): path to the audio file
-        sleep_during_playback (bool): means program will wait for length of audio file before returning
-        delete_file (bool): means file is deleted after playback (note that this shouldn't be used for multithreaded function calls)
-        play_using_music (bool): means it will use Pygame Music, if false then uses pygame Sound instead
+        sleep_during_playback (bool): means program will wait until the audio has played before returning
+        delete_file (bool): means file is deleted after it's loaded (it plays from memory, so this is safe even while it's playing)
+        Any format soundfile can read works (wav/flac/ogg/mp3). It's decoded and converted to the output format in this process.
+        play_using_music (bool): means it goes through the shared output stream, if false then uses pygame Sound instead (lets sounds overlap)
+        Returns False if it was skipped with F9.
         """
-        if not pygame.mixer.get_init(): # Reinitialize mixer if needed
-            pygame.mixer.init(frequency=48000, buffer=1024) 
         if play_using_music:
-            # Pygame Music can only play one file at a time
-            try:
-                pygame.mixer.music.load(file_path)
-                pygame.mixer.music.play()
-                converted = False
-            except:
-                # Wav files from Elevenlabs don't work with Pygame's Music for some fucking reason (works fine with Sound)
-                # If there's an error here that's likely why, so convert it to a format that Pygame can handle
-                # You can't convert the file in place so just convert it into a temp file that you delete later
-                converted_wav = "temp_convert.wav"
-                subprocess.run(["ffmpeg", "-y", "-i", file_path, "-ar", "48000", "-ac", "2", "-c:a", "pcm_s16le", converted_wav])
-                converted = True
-                pygame.mixer.music.load(converted_wav)
-                pygame.mixer.music.play()
-            # Wait for the music to finish playing, allow skip with F9
-            while pygame.mixer.music.get_busy():
-                if keyboard.is_pressed('f9'):
-                    print("[yellow]Audio skip requested (F9). Stopping music.")
-                    pygame.mixer.music.stop()
-                    return
-                time.sleep(0.05)
+            pcm = self.output.normalizer.load_file(file_path)
+            if delete_file:
+                try:
+                    os.remove(file_path)
+                except PermissionError:
+                    print(f"Couldn't remove {file_path} because it is being used by another process.")
+            if not self.output.play_pcm(pcm, wait=sleep_during_playback, skip_requested=self._skip_poller()):
+                return False
         else:
+            if not pygame.mixer.get_init(): # Initialize mixer if needed
+                pygame.mixer.init(frequency=48000, buffer=1024)
             # Pygame Sound lets you play multiple sounds simultaneously
             pygame_sound = pygame.mixer.Sound(file_path)
             channel = pygame_sound.play()
             # Wait for the sound to finish playing, allow skip with F9
-            while channel.get_busy():
+            while sleep_during_playback and channel.get_busy():
                 if keyboard.is_pressed('f9'):
                     print("[yellow]Audio skip requested (F9). Stopping sound.")
                     channel.stop()
-                    return
+                    return False
                 time.sleep(0.05)
-
-        if sleep_during_playback:
-            # Sleep until file is done playing
-            file_length = self.get_audio_length(file_path)
-            time.sleep(file_length)
-            # Delete the file
-            if delete_file:
-                # Stop Pygame so file can be deleted
-                # Note: this will stop the audio on other threads as well, so it's not good if you're playing multiple sounds at once
-                pygame.mixer.music.stop()
-                pygame.mixer.quit()
-                try:  
-                    os.remove(file_path)
-                    if converted:
-                        os.remove(converted_wav) # Remove the converted wav if it was created
-                except PermissionError:
-                    print(f"Couldn't remove {file_path} because it is being used by another process.")
         print(f"[green]Finished audio playback: {file_path}[/green]")
+        return True
+
+    def play_buffer(self, audio_buffer, wait=True):
+        """
+        Plays an in-memory AudioBuffer (e.g. from CoquiTTSManager.synthesize) without writing it to disk.
+        Blocks until playback is done (unless wait is False). F9 skips it, like play_audio, and then it returns False.
+        """
+        return self.output.play(audio_buffer, wait=wait, skip_requested=self._skip_poller())
+
+    def _skip_poller(self):
+        # F9 is only polled when playing to the sound card. Headless sinks ("null", "file:...") run where the keyboard module
+        # usually can't read keys (e.g. Linux without root), and it raises as soon as it's polled.
+        return self.skip_requested if self.skip_key_enabled and self.output.sink == "device" else None
+
+    def skip_requested(self):
+        # F9 skips whatever is playing. Only pressing the key counts, so holding it down (it's polled every few ms) is one skip, not several.
+        try:
+            pressed = keyboard.is_pressed('f9')
+        except Exception as e:
+            print(f"[yellow]Can't read the keyboard ({e}), F9 won't skip audio.")
+            self.skip_key_enabled = False
+            return False
+        newly_pressed = pressed and not self.skip_key_down
+        self.skip_key_down = pressed
+        if newly_pressed:
+            print("[yellow]Audio skip requested (F9). Stopping audio.")
+        return newly_pressed
+
+    def load_audio(self, file_path):
+        # Decodes an audio file into an AudioBuffer (in its original format)
+        with open(file_path, "rb") as f:
+            return AudioNormalizer.decode(f.read(), file_path)
+
+    def close(self):
+        self.output.close()
 
     async def play_audio_async(self, file_path):
         """
@@ -136,15 +152,43 @@ class AudioManager:
             print("No files to combine.")
         return output_file
     
-    def start_recording(self, stream):
+    def start_recording(self, stream, on_chunk=None):
         self.audio_frames = []
+        held_back = []  # Chunks from before the human started talking, only passed to on_chunk once they do
         while self.is_recording:
             data = stream.read(self.chunk)
             self.audio_frames.append(data)
+            frames = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+            self.endpointer.feed(frames.mean(axis=1) / 32768.0)
+            if on_chunk is None:
+                continue
+            if not self.endpointer.speech_started:
+                held_back.append(frames)
+                continue
+            if held_back:
+                # Start a little before the detected speech, so the first syllable isn't cut off
+                first_chunk = max(0, int((self.endpointer.speech_start_seconds - 0.3) * self.rate) // self.chunk)
+                for held_frames in held_back[first_chunk:]:
+                    on_chunk(held_frames, self.rate)
+                held_back = []
+            on_chunk(frames, self.rate)
+        # No speech was detected, pass everything on anyway rather than risk losing someone talking quietly
+        for held_frames in held_back:
+            on_chunk(held_frames, self.rate)
         print("[red]DONE RECORDING!")
 
-    def record_audio(self, end_recording_key='=', audio_device=None, channels=1):
+    def record_audio(self, end_recording_key='=', audio_device=None, channels=1, on_chunk=None, end_on_silence=None, trim_silence=True,
+                     as_array=False, save_file=True):
         # Records audio from an audio input device.
+        # on_chunk: optional function called from the recording thread with every chunk as it's recorded (int16 frames, sample rate),
+        # e.g. StreamingTranscriber.feed to transcribe while recording. It has to return quickly, or chunks get dropped.
+        # With voice activity detection (see vad.py), silence before the human starts talking isn't passed to on_chunk.
+        # end_on_silence: hands-free mode, stop recording after this many seconds of silence once the human has said something.
+        # The end key still works too. None = only the end key stops it.
+        # trim_silence: cut the silence before and after the speech out of the saved recording, so Whisper has less to transcribe
+        # as_array: return the recording as a 16 kHz mono float32 NumPy array (what Whisper takes) instead of a file path,
+        # so it goes straight to WhisperManager.audio_to_text without being written and decoded again
+        # save_file: also write the recording to audio_in/. Always on when as_array is False, since the path is what's returned.
         # Example device names are "Line In (Realtek(R) Audio)", "Sample (TC-Helicon GoXLR)", or just leave empty to use default mic
         # For some reason this doesn't work on the Broadcast GoXLR Mix, the other 3 GoXLR audio inputs all work fine.
         # Both Azure Speech-to-Text AND this script have issues listening to Broadcast Stream Mix, so just ignore it.
@@ -177,31 +221,51 @@ class AudioManager:
                     
         # Start recording an a second thread
         self.is_recording = True
-        threading.Thread(target=self.start_recording, args=(audio_stream,)).start()
+        vad = VoiceActivityDetector(self.rate)
+        self.endpointer = SpeechEndpointer(vad, silence_s=end_on_silence or 1.0)
+        recording_thread = threading.Thread(target=self.start_recording, args=(audio_stream, on_chunk))
+        recording_thread.start()
 
-        # Wait until end key is pressed
+        # Wait until end key is pressed (or the human stops talking, in hands-free mode)
         while True:
             if keyboard.is_pressed(end_recording_key):
                 break
+            if end_on_silence and self.endpointer.ended:
+                print(f"[blue]Heard {end_on_silence}s of silence, stopping the recording.")
+                break
             time.sleep(0.05) # Add this to reduce CPU usage
         
         self.is_recording = False
-        time.sleep(0.1) # Just for safety, no clue if this is needed
-
-        # Create audio_in directory if it doesn't exist
-        os.makedirs("audio_in", exist_ok=True)
-        filename = f"audio_in/mic_recording_{int(time.time())}.wav"
-        wave_file = wave.open(filename, 'wb')
-        wave_file.setnchannels(self.channels)
-        wave_file.setsampwidth(audio.get_sample_size(self.audio_format))
-        wave_file.setframerate(self.rate)
-        wave_file.writeframes(b''.join(self.audio_frames))
-        wave_file.close()
+        recording_thread.join()  # Wait for the last chunk
 
         # Close the stream and PyAudio
         audio_stream.stop_stream()
         audio_stream.close()
         audio.terminate()
 
+        pcm = np.frombuffer(b''.join(self.audio_frames), dtype=np.int16).reshape(-1, self.channels)
+        mono = pcm.mean(axis=1, dtype=np.float32) / 32768.0
+        if trim_silence:
+            bounds = vad.speech_bounds(mono)
+            # If no speech was found at all, keep everything rather than risk throwing away someone talking quietly
+            if bounds is not None:
+                print(f"[grey]Trimmed {(len(pcm) - (bounds[1] - bounds[0])) / self.rate:.1f}s of silence from the recording.")
+                pcm = pcm[bounds[0]:bounds[1]]
+                mono = mono[bounds[0]:bounds[1]]
+
+        filename = None
+        if save_file or not as_array:
+            # Create audio_in directory if it doesn't exist
+            os.makedirs("audio_in", exist_ok=True)
+            filename = f"audio_in/mic_recording_{int(time.time())}.wav"
+            wave_file = wave.open(filename, 'wb')
+            wave_file.setnchannels(self.channels)
+            wave_file.setsampwidth(2)
+            wave_file.setframerate(self.rate)
+            wave_file.writeframes(pcm.tobytes())
+            wave_file.close()
+        if as_array:
+            # Resampled once, for the whole recording
+            return resample(mono, self.rate, WHISPER_SAMPLE_RATE)
         return filename
 
@@ -0,0 +1,136 @@
+# Transcribes a whole folder of recordings (audio_in/ by default) in one pass, e.g. to re-process a stream's worth of mic captures
+# Clips are decoded and resampled to 16 kHz in this process, then fed to Whisper in batches (see WhisperManager.transcribe_batch).
+# Every result is appended to a JSONL index as soon as it's done, one line per file:
+#   {"file": "audio_in/mic_recording_1718000000.wav", "size": 123456, "mtime": 1718000000.5, "timestamps": "sentence",
+#    "duration": 4.2, "text": "...", "chunks": [{"text": ..., "start_time": ..., "end_time": ...}]}
+# Files that are already in the index (same size, modification time and timestamp mode) are skipped, so an interrupted run
+# picks up where it stopped, and running it again later only transcribes the new recordings.
+#   python batch_transcribe.py
+#   python batch_transcribe.py audio_in/ old_streams/ --timestamps word --model-size small.en --batch-size 8
+import os
+import sys
+import json
+import time
+import argparse
+from rich import print
+from audio_normalize import resample
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg")
+WHISPER_SAMPLE_RATE = 16000
+
+def find_audio_files(paths):
+    # Expands folders into the audio files inside them (not recursive), oldest first
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            entries = [os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(AUDIO_EXTENSIONS)]
+            files.extend(sorted(entries, key=os.path.getmtime))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"[yellow]Skipping {path}, it doesn't exist.")
+    return list(dict.fromkeys(files))
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def load_index(index_path):
+    # Returns {file: entry} for everything already transcribed. A line cut off by a crash is ignored (that file is just redone).
+    done = {}
+    if not os.path.exists(index_path):
+        return done
+    with open(index_path, "r", encoding="utf-8") as index_file:
+        for line in index_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[entry["file"]] = entry
+    return done
+
+
+def is_done(entry, path, timestamps):
+    if entry is None or entry.get("timestamps") != timestamps:
+        return False
+    size, mtime = file_signature(path)
+    return entry["size"] == size and entry["mtime"] == mtime
+
+
+def decode_for_whisper(path):
+    # Any file soundfile can read -> 16 kHz mono float32
+    import soundfile as sf
+    samples, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    return resample(samples.mean(axis=1), sample_rate, WHISPER_SAMPLE_RATE), WHISPER_SAMPLE_RATE
+
+
+def transcribe_files(whisper, files, index_path, timestamps="sentence", batch_size=16, force=False):
+    """
+    Transcribes every file that isn't in the index yet and appends the results to it.
+    Returns (number transcribed, number skipped, number that failed to decode).
+    """
+    done = {} if force else load_index(index_path)
+    todo = [path for path in files if not is_done(done.get(path), path, timestamps)]
+    skipped = len(files) - len(todo)
+    failed = []
+    decoded = []  # Files that decoded, in the order the pipeline asks for them, so results can be matched up
+
+    def clips():
+        for path in todo:
+            try:
+                clip = decode_for_whisper(path)
+            except Exception as e:
+                print(f"[red]Can't read {path}: {e}")
+                failed.append(path)
+                continue
+            decoded.append((path, len(clip[0]) / clip[1]))
+            yield clip
+
+    if os.path.dirname(index_path):
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    transcribed = 0
+    with open(index_path, "a", encoding="utf-8") as index_file:
+        for result in whisper.transcribe_batch(clips(), timestamps=timestamps, batch_size=batch_size):
+            path, duration = decoded[transcribed]
+            size, mtime = file_signature(path)
+            entry = {"file": path, "size": size, "mtime": mtime, "timestamps": timestamps, "duration": round(duration, 3)}
+            if timestamps is None:
+                entry["text"] = result.strip()
+            else:
+                entry["text"] = "".join(chunk["text"] for chunk in result).strip()
+                entry["chunks"] = result
+            index_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            index_file.flush()  # So a crash only loses the clip in progress
+            transcribed += 1
+            print(f"[green]({transcribed}/{len(todo)}) {path}: {entry['text'][:80]}")
+    return transcribed, skipped, len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe a folder of recordings with Whisper into a JSONL index")
+    parser.add_argument("paths", nargs="*", default=["audio_in"], help="folders and/or audio files (default: audio_in/)")
+    parser.add_argument("--index", default="audio_in/transcripts.jsonl", help="JSONL file the results are appended to")
+    parser.add_argument("--timestamps", choices=["none", "sentence", "word"], default="sentence")
+    parser.add_argument("--batch-size", type=int, default=16, help="30 second chunks per forward pass")
+    parser.add_argument("--model-size", default=None, help="Whisper model, e.g. base.en or large-v3 (default: depends on GPU/CPU)")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--force", action="store_true", help="transcribe every file again, even ones already in the index")
+    args = parser.parse_args()
+    timestamps = None if args.timestamps == "none" else args.timestamps
+
+    files = find_audio_files(args.paths)
+    if not files:
+        sys.exit("No audio files found.")
+    from whisper_openai import WhisperManager
+    whisper = WhisperManager(model_size=args.model_size, device=args.device)
+    start = time.perf_counter()
+    transcribed, skipped, failed = transcribe_files(whisper, files, args.index, timestamps=timestamps,
+                                                    batch_size=args.batch_size, force=args.force)
+    print(f"[blue]Transcribed {transcribed} files in {time.perf_counter() - start:.1f}s "
+          f"({skipped} already in {args.index}, {failed} unreadable).")
+    print(f"[blue]{whisper.report()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Measures turn throughput, memory and thread count of the asyncio Orchestrator at 3, 10 and 50 agents
+# The LLM, TTS and playback stages are replaced with fakes that just wait, so this measures the orchestration itself
+# (scheduling, history bookkeeping, pipelining) and runs without Ollama, Coqui or a sound card.
+#   python benchmarks/bench_orchestrator.py
+#   python benchmarks/bench_orchestrator.py --agents 3,10,50 --turns 300 --llm-ms 20 --tts-ms 10 --play-ms 30
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent_context import estimate_tokens
+from orchestrator import AsyncAgent, Orchestrator
+from speech_pipeline import split_sentences
+
+REPLY = "I completely disagree, the greatest game ever made is obviously the one with the best soundtrack. Fight me!"
+# Every sentence is synthesized and played as its own clip, so a turn costs this many TTS calls and playbacks
+CLIPS_PER_TURN = len(split_sentences(REPLY))
+
+def build_agents(count):
+    agents = []
+    for i in range(count):
+        prompt = {"role": "system", "content": "You are debating the best videogames of all time. Answer in 4 sentences or less."}
+        agents.append(AsyncAgent(f"AGENT_{i + 1}", i + 1, prompt, count_tokens=estimate_tokens))
+    return agents
+
+async def run_once(num_agents, turns, llm_ms, tts_ms, play_ms):
+    max_threads = threading.active_count()
+
+    async def generate(agent, messages):
+        await asyncio.sleep(llm_ms / 1000)
+        return REPLY
+
+    def synthesize(agent, text):
+        # Blocking, like Coqui. Runs on the orchestrator's TTS thread pool.
+        time.sleep(tts_ms / 1000)
+        return text
+
+    async def play(agent, audio):
+        nonlocal max_threads
+        max_threads = max(max_threads, threading.active_count())
+        await asyncio.sleep(play_ms / 1000)
+
+    agents = build_agents(num_agents)
+    orchestrator = Orchestrator(agents, generate, synthesize, play)
+    start = time.perf_counter()
+    await orchestrator.run(first_speaker=agents[0], max_turns=turns)
+    elapsed = time.perf_counter() - start
+    orchestrator.tts_executor.shutdown()
+    return elapsed, max_threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the asyncio orchestrator with fake stages")
+    parser.add_argument("--agents", default="3,10,50")
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--llm-ms", type=float, default=20)
+    parser.add_argument("--tts-ms", type=float, default=10)
+    parser.add_argument("--play-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    # With pipelining, the best possible rate is one turn per turn's worth of playback (every clip in it), so the slowest stage sets the ceiling
+    ideal = 1000 / max(args.play_ms * CLIPS_PER_TURN, args.llm_ms, args.tts_ms * CLIPS_PER_TURN)
+    print(f"{args.turns} turns per run, {CLIPS_PER_TURN} clips per turn, LLM {args.llm_ms}ms, TTS {args.tts_ms}ms per clip, "
+          f"playback {args.play_ms}ms per clip (ideal ~{ideal:.1f} turns/s)")
+    print(f"{'agents':>7} {'turns/s':>9} {'ms/turn':>9} {'peak MB':>9} {'threads':>8}")
+    for num_agents in [int(n) for n in args.agents.split(",")]:
+        tracemalloc.start()
+        elapsed, threads = asyncio.run(run_once(num_agents, args.turns, args.llm_ms, args.tts_ms, args.play_ms))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{num_agents:>7} {args.turns / elapsed:>9.1f} {elapsed * 1000 / args.turns:>9.1f} {peak / 1e6:>9.2f} {threads:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Measures how much of each agent's conversation Ollama has to prefill every turn, as the history grows
+# Runs a fake conversation between a few agents and records Ollama's prompt_eval_count / prompt_eval_duration for every turn.
+#   generate: flattens the whole history into one prompt for /api/generate (the old Agent.run behaviour)
+#   chat:     sends the history as role messages to /api/chat (OLLAMA_USE_CHAT = True)
+# In chat mode the prefilled token count should stay roughly flat (only the new messages), while it grows with the history otherwise.
+# Ollama needs one cache slot per agent for this, so start it with OLLAMA_NUM_PARALLEL set to at least --agents:
+#   OLLAMA_NUM_PARALLEL=3 ollama serve
+#   python benchmarks/bench_prefill.py --turns 30
+import os
+import sys
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_client import OllamaClient
+
+FILLER_LINES = [
+    "I still think Ocarina of Time is the greatest game ever made, the dungeons alone are masterpieces.",
+    "Absolutely not, Half-Life 2 changed how every shooter after it was designed, nothing comes close.",
+    "You are both forgetting Tetris, which has been played by more people than any other game in history!",
+    "The soundtrack of Chrono Trigger makes me cry every single time, and the time travel plot is genius.",
+]
+
+def build_agents(num_agents):
+    agents = []
+    for i in range(num_agents):
+        name = f"AGENT_{i + 1}"
+        history = [{"role": "system", "content": f" Your real name is {name}. You are debating the best videogames of all time. Answer in 1 sentence."}]
+        agents.append((name, history))
+    return agents
+
+def run(mode, client, turns, num_agents, options):
+    agents = build_agents(num_agents)
+    rows = []
+    for turn in range(turns):
+        name, history = agents[turn % num_agents]
+        if mode == "chat":
+            data = client.chat(history, options=options, raw=True)
+        else:
+            prompt = '\n'.join([str(msg["content"]) for msg in history])
+            data = client.generate(prompt, options=options, raw=True)
+        # Use a fixed reply instead of the generated one, so both modes see exactly the same conversation
+        reply = FILLER_LINES[turn % len(FILLER_LINES)]
+        for other_name, other_history in agents:
+            if other_name == name:
+                other_history.append({"role": "assistant", "content": reply})
+            else:
+                other_history.append({"role": "user", "content": f"[{name}] {reply}"})
+        rows.append((turn + 1, len(history), data.get("prompt_eval_count", 0), data.get("prompt_eval_duration", 0) / 1e6))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-turn prefill cost of /api/generate vs /api/chat")
+    parser.add_argument("--model", default="gemma3n:e4b")
+    parser.add_argument("--host", default="http://localhost:11434")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--modes", default="generate,chat")
+    args = parser.parse_args()
+
+    client = OllamaClient(args.host, model=args.model, read_timeout=300)
+    # Only decode a couple of tokens, we only care about prefill here
+    options = {"num_predict": 2, "temperature": 0}
+    client.generate("hi", options=options)  # load the model so the first measured turn doesn't include load time
+
+    for mode in args.modes.split(","):
+        rows = run(mode, client, args.turns, args.agents, options)
+        print(f"\n=== {mode} ===")
+        print(f"{'turn':>5} {'messages':>9} {'prefill tokens':>15} {'prefill ms':>11}")
+        for turn, messages, count, ms in rows:
+            print(f"{turn:>5} {messages:>9} {count:>15} {ms:>11.1f}")
+        last = rows[-args.agents:]
+        print(f"avg prefill over last {len(last)} turns: {sum(r[2] for r in last) / len(last):.0f} tokens, {sum(r[3] for r in last) / len(last):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Times resuming a long conversation from the conversation log (conversation_log.py), the way multi_agent_gpt.py does at startup:
+# open the log (tail check + offset index), then read the newest messages until a context budget is full.
+# Writes a synthetic log of --messages messages into a temporary folder, so it runs without Ollama or any saved session.
+#   python benchmarks/bench_resume.py
+#   python benchmarks/bench_resume.py --messages 100000 --budget 6000
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from conversation_log import ConversationLog
+from message_store import MessageStore
+from agent_context import AgentContext, estimate_tokens
+
+SPEAKERS = ["OSWALD", "TONY KING OF NEW YORK", "VICTORIA", "HUMAN_TEXT"]
+
+def write_log(path, count):
+    # Written directly instead of through append(), which is much slower for this many lines because it fsyncs
+    with open(path, "w", encoding="utf-8") as log_file:
+        for i in range(count):
+            content = f"Message {i}: " + "I can't believe you just said that about the final boss, it's the best part of the game. " * 2
+            log_file.write(json.dumps({"seq": i, "time": 1700000000.0 + i, "speaker": SPEAKERS[i % len(SPEAKERS)], "content": content}) + "\n")
+
+def resume(path, budget, keep_recent):
+    log = ConversationLog(path)
+    store = MessageStore(count_tokens=estimate_tokens)
+    records, tokens = [], []
+    total_tokens = 0
+    for record in log.read_backwards():
+        records.append(record)
+        tokens.append(store.count_tokens(record["content"]))
+        total_tokens += tokens[-1]
+        if total_tokens >= budget and len(records) >= keep_recent:
+            break
+    for record, record_tokens in zip(reversed(records), reversed(tokens)):
+        store.append(record["speaker"], record["content"], timestamp=record["time"], tokens=record_tokens)
+    for name in SPEAKERS[:3]:
+        view = store.view(name)
+        context = AgentContext(f"You are {name}", token_budget=budget, keep_recent=keep_recent, count_tokens=estimate_tokens)
+        context.restore([(view[i], view.tokens(i)) for i in range(len(view))])
+    count = len(log)
+    log.close()
+    return len(records), count
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resuming a conversation from the JSONL log")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--keep-recent", type=int, default=12)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "conversation.jsonl")
+        write_log(path, args.messages)
+        print(f"{args.messages} messages, {os.path.getsize(path) / 1e6:.1f} MB log, {args.budget} token budget")
+        for label in ["first start (builds the index)", "resume (index exists)"]:
+            start = time.perf_counter()
+            loaded, total = resume(path, args.budget, args.keep_recent)
+            print(f"  {label:<32} {time.perf_counter() - start:.3f}s, loaded {loaded} of {total} messages")
+        # For comparison: reading and parsing the whole log, like the old full-file backups needed
+        start = time.perf_counter()
+        with open(path, "r", encoding="utf-8") as log_file:
+            records = [json.loads(line) for line in log_file]
+        print(f"  {'parse the whole log':<32} {time.perf_counter() - start:.3f}s, {len(records)} messages")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Compares the NumPy WSOLA time-stretch (time_stretch.py) against pydub's speedup, which CoquiTTSManager used before
+# Uses a synthetic speech-like signal (a pitch-varying harmonic tone with syllable-rate amplitude changes and a bit of noise)
+# at the vctk/vits output rate of 22050 Hz, so it runs without Coqui or any audio files.
+#   python benchmarks/bench_time_stretch.py
+#   python benchmarks/bench_time_stretch.py --durations 5,30,120 --speed 1.15 --repeats 3
+import os
+import sys
+import time
+import argparse
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from time_stretch import time_stretch
+
+def speech_like(duration, sample_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)  # slowly gliding fundamental
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(h * phase) / h for h in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)  # ~4 syllables per second with gaps
+    signal = 0.2 * voice * syllables + 0.005 * rng.standard_normal(t.shape[0])
+    return signal.astype(np.float32)
+
+def pydub_speedup(samples, sample_rate, speed):
+    from pydub import AudioSegment
+    sound = AudioSegment(data=(np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
+    sped_up = sound.speedup(playback_speed=speed, chunk_size=150, crossfade=25)
+    return np.frombuffer(sped_up.raw_data, dtype=np.int16)
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WSOLA time-stretch vs pydub speedup")
+    parser.add_argument("--durations", default="5,30,120")
+    parser.add_argument("--speed", type=float, default=1.15)
+    parser.add_argument("--sample-rate", type=int, default=22050)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import pydub  # noqa: F401
+        have_pydub = True
+    except ImportError:
+        have_pydub = False
+        print("pydub is not installed, only timing the NumPy version")
+
+    print(f"speed {args.speed}x, {args.sample_rate} Hz, best of {args.repeats}")
+    print(f"{'clip':>6} {'numpy s':>9} {'x realtime':>11} {'pydub s':>9} {'x realtime':>11} {'speedup':>8}")
+    for duration in [float(d) for d in args.durations.split(",")]:
+        samples = speech_like(duration, args.sample_rate)
+        numpy_time, stretched = best_time(lambda: time_stretch(samples, args.speed, args.sample_rate), args.repeats)
+        row = f"{duration:>5.0f}s {numpy_time:>9.3f} {duration / numpy_time:>11.0f}"
+        if have_pydub:
+            pydub_time, _ = best_time(lambda: pydub_speedup(samples, args.sample_rate, args.speed), args.repeats)
+            row += f" {pydub_time:>9.3f} {duration / pydub_time:>11.0f} {pydub_time / numpy_time:>7.1f}x"
+        print(row)
+        expected = samples.shape[0] / args.speed
+        assert abs(stretched.shape[0] - expected) <= 1, "stretched length should be len / speed"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Measures Whisper's real-time factor (seconds spent transcribing per second of audio) for different model sizes and settings
+# Each configuration is "<model size>[:int8|:fp32][:<threads>t]", for example base.en:int8:4t. Every configuration is loaded
+# (with its warm-up pass), transcribes the same clips, and reports its load time and real-time factor. Lower is faster.
+# Uses your recordings in audio_in/ (or --audio), since Whisper's speed depends on how much it has to say.
+#   python benchmarks/bench_whisper.py
+#   python benchmarks/bench_whisper.py --configs tiny.en:int8,base.en:int8,base.en:fp32,small.en:int8 --audio audio_in/mic_recording_1.wav
+import os
+import sys
+import glob
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from whisper_openai import WhisperManager
+
+def parse_config(config):
+    # "small.en:int8:4t" -> ("small.en", True, 4)
+    parts = config.split(":")
+    model_size, quantize, threads = parts[0], None, None
+    for part in parts[1:]:
+        if part in ("int8", "fp32"):
+            quantize = part == "int8"
+        elif part.endswith("t"):
+            threads = int(part[:-1])
+        else:
+            raise ValueError(f"Unknown option '{part}' in configuration '{config}'")
+    return model_size, quantize, threads
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper configurations by real-time factor")
+    parser.add_argument("--configs", default="tiny.en:int8,base.en:int8,base.en:fp32,small.en:int8,small.en:fp32")
+    parser.add_argument("--audio", nargs="*", help="audio files to transcribe (default: the 5 newest files in audio_in/)")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    files = args.audio or sorted(glob.glob("audio_in/*.wav"), key=os.path.getmtime)[-5:]
+    if not files:
+        sys.exit("No audio to transcribe. Record something in voice mode first (VOICE_SAVE_RECORDINGS = True) or pass --audio.")
+    print(f"{len(files)} clips on {args.device}")
+    print(f"{'configuration':<22} {'load s':>7} {'audio s':>8} {'busy s':>7} {'RTF':>6}")
+    for config in args.configs.split(","):
+        model_size, quantize, threads = parse_config(config)
+        start = time.perf_counter()
+        whisper = WhisperManager(model_size=model_size, device=args.device, quantize=quantize, num_threads=threads)
+        load_time = time.perf_counter() - start
+        for file in files:
+            whisper.audio_to_text(file)
+        print(f"{config:<22} {load_time:>7.1f} {whisper.audio_seconds:>8.1f} {whisper.processing_seconds:>7.1f} {whisper.real_time_factor:>6.2f}")
+        del whisper
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# ConversationLog: The whole conversation as an append-only JSONL file, one line per message, written once no matter how many agents there are
+#   {"seq": 41, "time": 1718000000.123, "speaker": "OSWALD", "content": "..."}
+# Replaces rewriting every agent's full history (as a Python repr) to its own backup file after every message,
+# which cost O(agents x history) bytes per turn under the conversation lock. Now a turn costs one short append.
+# Every line is flushed to the OS right away, so it survives the program crashing. fsync (surviving a power cut) happens at most
+# every fsync_interval seconds, so it doesn't stall the conversation lock on every message.
+# A line that was only half written when the program died is cut off the next time the log is opened, and the log carries on from there.
+# compact() rewrites the log without damaged lines and can move old messages out to an archive, so the live file stays small.
+# A sidecar index (<log>.idx) holds the byte offset of every line as a little-endian uint64, so the newest messages can be read
+# straight out of a memory-mapped log (read_backwards) without parsing the whole thing. That's what makes resuming a long session fast.
+# If the index doesn't match the log (a crash between the two writes, or the log was edited), it's rebuilt from the log's newlines.
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+from array import array
+import numpy as np
+from rich import print
+
+class ConversationLog:
+    """
+    Parameters:
+    path (str): the JSONL file. Created (with its folder) if it doesn't exist.
+    fsync_interval (float): most seconds between fsyncs. 0 = fsync after every message.
+    """
+
+    def __init__(self, path="backup_history/conversation.jsonl", fsync_interval=1.0):
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + ".idx"
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.recover()
+        self.offsets = self._load_index()
+        self.file = open(path, "ab")
+        self.index_file = open(self.index_path, "ab")
+        self.size = self.file.tell()
+        last = self._last_record()
+        self.next_seq = last["seq"] + 1 if last else 0
+        self.last_fsync = time.monotonic()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, speaker, content):
+        # Writes one message and returns its record (None once the log is closed)
+        with self.lock:
+            if self.file.closed:
+                # Shutting down. An agent that finishes its turn after close() doesn't get logged.
+                return None
+            record = {"seq": self.next_seq, "time": round(time.time(), 3), "speaker": speaker, "content": content}
+            line = self._encode(record)
+            self.file.write(line)
+            self.file.flush()
+            # The log line goes first: an index entry never points at a line that isn't there
+            self.index_file.write(struct.pack("<Q", self.size))
+            self.index_file.flush()
+            self.offsets.append(self.size)
+            self.size += len(line)
+            self.next_seq += 1
+            if time.monotonic() - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                os.fsync(self.index_file.fileno())
+                self.last_fsync = time.monotonic()
+        return record
+
+    def read(self):
+        # Returns every record in the log, oldest first, skipping lines that can't be parsed
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+            return self._read_records(self.path)[0]
+
+    def read_backwards(self):
+        # Yields records newest first. Only the lines that are actually read get parsed, via the offset index and a memory map,
+        # so reading the last few hundred messages of a huge log costs the same as reading them from a small one.
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+            offsets, count, end = self.offsets, len(self.offsets), self.size
+        if count == 0:
+            return
+        with open(self.path, "rb") as log_file, mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            for i in range(count - 1, -1, -1):
+                start = offsets[i]
+                line = log_map[start:end]
+                end = start
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print(f"[yellow]Skipping a damaged line in the conversation log {self.path}.")
+
+    def recover(self):
+        # Cuts off a half-written last line (left by a crash partway through a write). Only looks at the end of the file.
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, "r+b") as log_file:
+            with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                size = len(log_map)
+                if log_map[size - 1:size] == b"\n":
+                    return
+                # Every complete line ends with a newline, so anything after the last one was cut off mid-write
+                torn_at = log_map.rfind(b"\n") + 1
+            print(f"[yellow]Conversation log {self.path} ended with a half-written line, removing it.")
+            log_file.truncate(torn_at)
+
+    def compact(self, keep_last=None, archive_path=None):
+        """
+        Rewrites the log with only the records that parse, safely: a new file is written and fsynced, then swapped in.
+        keep_last: only keep this many of the newest messages. The older ones are appended to archive_path
+                   (default: <log>.archive.jsonl), so nothing is lost.
+        Returns how many records were moved to the archive.
+        """
+        if keep_last is not None and keep_last < 0:
+            raise ValueError(f"keep_last can't be negative, got {keep_last}")
+        with self.lock:
+            self.file.flush()
+            records = self._read_records(self.path)[0]
+            # Not records[:-keep_last], which is empty for keep_last=0
+            archived = records[:len(records) - keep_last] if keep_last is not None and len(records) > keep_last else []
+            if archived:
+                archive_path = archive_path or os.path.splitext(self.path)[0] + ".archive.jsonl"
+                with open(archive_path, "ab") as archive_file:
+                    archive_file.write(b"".join(self._encode(record) for record in archived))
+                    archive_file.flush()
+                    os.fsync(archive_file.fileno())
+                records = records[len(archived):]
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as temp_file:
+                temp_file.write(b"".join(self._encode(record) for record in records))
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            self.file.close()
+            self.index_file.close()
+            os.replace(temp_path, self.path)
+            self.offsets = self._rebuild_index()
+            self.file = open(self.path, "ab")
+            self.index_file = open(self.index_path, "ab")
+            self.size = self.file.tell()
+            self.last_fsync = time.monotonic()
+        return len(archived)
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.index_file.flush()
+            os.fsync(self.index_file.fileno())
+            self.file.close()
+            self.index_file.close()
+
+    def _last_record(self):
+        for record in self.read_backwards():
+            return record
+        return None
+
+    def _load_index(self):
+        # Returns the offsets from the sidecar index (as an array("Q")), rebuilding it if it doesn't match the log
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if size == 0 and index_size == 0:
+            return array("Q")
+        if index_size and index_size % 8 == 0:
+            offsets = np.fromfile(self.index_path, dtype="<u8")
+            last = int(offsets[-1])
+            # The index matches if its last entry is the start of the log's last line
+            if last < size:
+                with open(self.path, "rb") as log_file, mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                    matches = (last == 0 or log_map[last - 1:last] == b"\n") and log_map.find(b"\n", last) == size - 1
+                if matches:
+                    return array("Q", offsets.astype(np.uint64).tobytes())
+        print(f"[yellow]Rebuilding the conversation log index {self.index_path}.")
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        # Every line starts right after a newline
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size:
+            with open(self.path, "rb") as log_file, mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+                newlines = np.flatnonzero(np.frombuffer(log_map, dtype=np.uint8) == 10)
+            offsets = np.concatenate([[0], newlines[:-1] + 1]).astype("<u8")
+        else:
+            offsets = np.zeros(0, dtype="<u8")
+        temp_path = self.index_path + ".tmp"
+        offsets.tofile(temp_path)
+        os.replace(temp_path, self.index_path)
+        return array("Q", offsets.astype(np.uint64).tobytes())
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+    @staticmethod
+    def _read_records(path):
+        # Returns (records, byte offset of a half-written last line or None)
+        if not os.path.exists(path):
+            return [], None
+        with open(path, "rb") as log_file:
+            data = log_file.read()
+        records = []
+        lines = data.split(b"\n")
+        # Every complete line ends with a newline, so anything after the last one was cut off mid-write
+        torn_at = len(data) - len(lines[-1]) if lines[-1] else None
+        for line in lines[:-1]:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                print(f"[yellow]Skipping a damaged line in the conversation log {path}.")
+        return records, torn_at
@@ -1,11 +1,15 @@
 # CoquiTTSManager: Wrapper for Coqui TTS
 from TTS.api import TTS
 import os
-import soundfile as sf
+import numpy as np
 from pydub import AudioSegment
+from audio_buffer import AudioBuffer
+from time_stretch import time_stretch
+from tts_cache import tts_cache_key
 
 class CoquiTTSManager:
     def __init__(self, model_name="tts_models/en/ljspeech/tacotron2-DDC", gpu=False):
+        self.model_name = model_name
         self.tts = TTS(model_name=model_name, progress_bar=False, gpu=gpu)
         self.sample_rate = self.tts.synthesizer.output_sample_rate
         # Print available voices for this TTS model
@@ -14,31 +18,37 @@ class CoquiTTSManager:
         # else:
         #     print(f"[yellow]No speaker list found for model '{model_name}'.")
 
-    def text_to_audio(self, input_text, save_as_wave=True, subdirectory="audio_msg", speaker=None, speedup=1.15):
+    # Synthesizes speech and returns it as an in-memory AudioBuffer (NumPy PCM + sample rate), without writing any files
+    def synthesize(self, input_text, speaker=None, speedup=1.15):
         if speaker:
             print(f"[blue]CoquiTTSManager: Using speaker '{speaker}' for synthesis.")
             wav = self.tts.tts(input_text, speaker=speaker)
         else:
             wav = self.tts.tts(input_text)
+        buffer = AudioBuffer(np.asarray(wav, dtype=np.float32), self.sample_rate)
+        if speedup != 1.0:
+            buffer = self.speed_up(buffer, speedup)
+        return buffer
+
+    # Speeds up the audio without changing its pitch, using the NumPy WSOLA time-stretch (see time_stretch.py)
+    def speed_up(self, buffer, speedup):
+        return AudioBuffer(time_stretch(buffer.samples, speedup, buffer.sample_rate), buffer.sample_rate)
+
+    # Synthesizes speech and saves it to a file in the subdirectory. Returns the file path.
+    def text_to_audio(self, input_text, save_as_wave=True, subdirectory="audio_msg", speaker=None, speedup=1.15):
+        buffer = self.synthesize(input_text, speaker=speaker, speedup=speedup)
         # Ensure the subdirectory exists
         output_dir = os.path.join(os.path.abspath(os.curdir), subdirectory)
         os.makedirs(output_dir, exist_ok=True)
+        # Named after everything that went into the clip, so different voices saying the same line don't overwrite each other
+        digest = tts_cache_key(self.model_name, speaker, input_text, speedup, self.sample_rate)
         if save_as_wave:
-            file_name = f"___Msg{str(hash(input_text))}.wav"
+            file_name = f"___Msg{digest}.wav"
             tts_file = os.path.join(output_dir, file_name)
-            sf.write(tts_file, wav, self.sample_rate)
-            # Speed up audio with pydub if needed
-            if speedup != 1.0:
-                sound = AudioSegment.from_wav(tts_file)
-                so = sound.speedup(playback_speed=speedup, chunk_size=150, crossfade=25)
-                so.export(tts_file, format="wav")
+            buffer.write(tts_file)
         else:
-            file_name = f"___Msg{str(hash(input_text))}.mp3"
+            file_name = f"___Msg{digest}.mp3"
             tts_file = os.path.join(output_dir, file_name)
-            sf.write(tts_file, wav, self.sample_rate)
-            # Speed up audio with pydub if needed
-            if speedup != 1.0:
-                sound = AudioSegment.from_file(tts_file)
-                so = sound.speedup(playback_speed=speedup, chunk_size=150, crossfade=25)
-                so.export(tts_file, format="mp3")
+            sound = AudioSegment(data=buffer.to_int16().tobytes(), sample_width=2, frame_rate=buffer.sample_rate, channels=1)
+            sound.export(tts_file, format="mp3")
         return tts_file
@@ -0,0 +1,115 @@
+# MessageStore: The conversation, stored once for every agent
+# Instead of every agent keeping its own copy of every message (agents x messages dicts and strings), messages live in one store
+# as parallel arrays: an interned speaker id, the content string, a token count and a timestamp per message.
+# Each agent looks at the store through a ConversationView, which works out its roles when a message is read:
+# the agent's own messages are "assistant", everyone else's are "user" with a "[NAME] " prefix.
+# Token counts are calculated once per message when it's stored, instead of once per agent.
+import sys
+import time
+import threading
+from array import array
+from agent_context import get_token_counter
+
+class MessageStore:
+    """
+    Parameters:
+    count_tokens (callable): counts the tokens in a string (see agent_context.py)
+    """
+
+    def __init__(self, count_tokens=None):
+        self.count_tokens = count_tokens or get_token_counter()
+        self.speakers = []  # speaker id -> interned name
+        self.speaker_ids = {}  # name -> speaker id
+        self.prefix_tokens = array("I")  # speaker id -> tokens in "[NAME] "
+        self.message_speakers = array("H")
+        self.contents = []
+        self.tokens = array("I")
+        self.times = array("d")
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.contents)
+
+    def append(self, speaker, content, timestamp=None, tokens=None):
+        # Stores a message and returns its index. tokens: its token count, if it's already been counted.
+        if tokens is None:
+            tokens = self.count_tokens(content)
+        with self.lock:
+            speaker_id = self.speaker_id(speaker)
+            self.message_speakers.append(speaker_id)
+            self.tokens.append(tokens)
+            self.times.append(timestamp if timestamp is not None else time.time())
+            # Appended last: a message only counts (len) once everything about it is stored
+            self.contents.append(content)
+            return len(self.contents) - 1
+
+    def speaker_id(self, speaker):
+        speaker_id = self.speaker_ids.get(speaker)
+        if speaker_id is None:
+            speaker = sys.intern(speaker)
+            speaker_id = len(self.speakers)
+            self.speakers.append(speaker)
+            self.speaker_ids[speaker] = speaker_id
+            # The prefix adds a few tokens to a message, minus the per-message overhead count_tokens already includes
+            self.prefix_tokens.append(max(0, self.count_tokens(f"[{speaker}] ") - self.count_tokens("")))
+        return speaker_id
+
+    def speaker(self, index):
+        return self.speakers[self.message_speakers[index]]
+
+    def view(self, name):
+        return ConversationView(self, name)
+
+
+class ConversationView:
+    """
+    One agent's view of the shared conversation. Reading a message projects it into the {"role", "content"} dict
+    that agent sends to the LLM, without storing a copy.
+    Rendered prompt lines (for /api/generate's flattened prompt) are cached, and each message is rendered only once.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.speaker_id = None  # Looked up lazily, since the agent might not have said anything yet
+        self.rendered = []  # Rendered lines for messages rendered_start onwards
+        self.rendered_start = 0
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        content = self.store.contents[index]
+        if self._is_own(index):
+            return {"role": "assistant", "content": content}
+        return {"role": "user", "content": f"[{self.store.speaker(index)}] {content}"}
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tokens(self, index):
+        # Tokens in this message as this agent sees it
+        if self._is_own(index):
+            return self.store.tokens[index]
+        return self.store.tokens[index] + self.store.prefix_tokens[self.store.message_speakers[index]]
+
+    def rendered_lines(self, start):
+        # The rendered text of every message from start onwards. Only messages that weren't rendered before are rendered now,
+        # and anything before start is dropped from the cache, since the caller's window only moves forward.
+        end = len(self)
+        if start < self.rendered_start or start > self.rendered_start + len(self.rendered):
+            self.rendered, self.rendered_start = [], start
+        elif start > self.rendered_start:
+            del self.rendered[:start - self.rendered_start]
+            self.rendered_start = start
+        for index in range(self.rendered_start + len(self.rendered), end):
+            self.rendered.append(self[index]["content"])
+        return self.rendered
+
+    def _is_own(self, index):
+        if self.speaker_id is None:
+            self.speaker_id = self.store.speaker_ids.get(self.name)
+            if self.speaker_id is None:
+                return False
+        return self.store.message_speakers[index] == self.speaker_id
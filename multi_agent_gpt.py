@@ -47,24 +47,39 @@
             # Turns off "pause" flag
             # Activates specific Agent
 
+# Turn Scheduler
+    # Agents block on the scheduler until it's their turn, instead of polling an "activated" flag
+    # Activating an agent, pausing and resuming all go through the scheduler
+
 from flask import Flask, render_template, session, request
 from flask_socketio import SocketIO, emit
 import threading
+import queue
 import time
 import keyboard
 import random
 import logging
 from rich import print
-import requests
 import platform
 import subprocess
 import signal
 import re
 import os
-from coqui_tts_manager import CoquiTTSManager
+from tts_registry import tts_registry
+from tts_service import TTSService
+from speech_pipeline import SentenceSplitter, SpeechPipeline, limit_sentences
+from streaming_asr import StreamingTranscriber
+from ollama_client import OllamaClient, OllamaError, ModelResidency, DEFAULT_NUM_CTX
+from agent_context import AgentContext, summary_prompt
+from speculative import SpeculativeDrafter
+from turn_scheduler import TurnScheduler
+from agent_config import load_agent_configs
+from conversation_log import ConversationLog
+from message_store import MessageStore
 
 from audio_player import AudioManager
-from whisper_openai import WhisperManager
+from audio_buffer import AudioBuffer
+from startup import StartupProfiler, LazyModel
 # from obs_websockets import OBSWebsocketsManager  # Uncomment to enable OBS integration
 from prompts.ai_prompts import *
 from prompts.ai_prompts_generic import *
@@ -86,22 +101,85 @@ def home():
 def connect():
     print("[green]The server connected to client!")
 
+# Times every startup step, and runs the slow ones (model loads, waiting for Ollama) in the background at the same time
+startup = StartupProfiler()
+
+def load_whisper():
+    # Imported here because importing torch and transformers alone takes seconds, and text mode never needs them
+    from whisper_openai import WhisperManager
+    return WhisperManager(model_size=WHISPER_MODEL_SIZE, quantize=WHISPER_QUANTIZE)
+
 # Manager instances
 # obswebsockets_manager = OBSWebsocketsManager()  # Uncomment to enable OBS integration
-whisper_manager = WhisperManager()
-coqui_manager = CoquiTTSManager()
-audio_manager = AudioManager()
+# Whisper only loads the first time voice mode is used
+whisper_manager = LazyModel("Whisper", load_whisper, profiler=startup)
+# Where the agents' audio goes: "device" (sound card), "null" (headless, plays into nothing in real time)
+# or "file:conversation.wav" (headless, records the whole conversation)
+AUDIO_OUTPUT = "device"
+audio_manager = AudioManager(output=AUDIO_OUTPUT)
 
 speaking_lock = threading.Lock()
 conversation_lock = threading.Lock()
 
-agents_paused = False
+# Owns who talks next. Agents wait on it for their turn, and pausing/activating agents goes through it.
+turn_scheduler = TurnScheduler()
 
 # Configuration
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_HOST = "http://localhost:11434"
 OLLAMA_MODEL = "gemma3n:e4b"  # Change to your preferred model
-BACKUP_FILE = "ChatHistoryBackup.txt"
+OLLAMA_READ_TIMEOUT = 120  # Seconds to wait for the next bytes from Ollama before giving up on a reply
+# True: send each agent's history as role messages to /api/chat. The history only ever grows at the end, so Ollama
+# reuses its KV cache for everything it has already seen and only prefills the new messages each turn.
+# False: flatten the whole history into one prompt for /api/generate (the old behaviour, re-prefills everything every turn)
+OLLAMA_USE_CHAT = True
+# How long Ollama keeps the model loaded after a request (Ollama's default is 5 minutes, so a pause in the conversation
+# meant the next turn paid for loading the model again). The model is also preloaded at startup and checked every few minutes.
+OLLAMA_KEEP_ALIVE = "30m"
+# Sent with every request. num_ctx has to be the same everywhere (preload, replies, summaries), or Ollama reloads the model
+# to change it. Ollama's default context (2048-4096 tokens) is smaller than CONTEXT_TOKEN_BUDGET, which silently cut off the
+# start of the prompt. Per-agent options (num_predict, stop, ...) and max_sentences are set in agents.json.
+OLLAMA_OPTIONS = {"num_ctx": DEFAULT_NUM_CTX}
+# True: TTS audio stays in memory as a NumPy buffer and is played straight from memory, no files involved.
+# False: TTS is written to audio_msg/ and played from the file (the old behaviour)
+TTS_IN_MEMORY = True
+TTS_ARCHIVE_AUDIO = False  # In memory mode, also save a copy of every clip to audio_msg/
+# Lines that were already said by the same voice are replayed from tts_cache/ (or memory) instead of synthesized again.
+# The hit rate is printed when the program exits.
+TTS_CACHE = True
+# 0: Coqui runs inside this process. 1 or more: Coqui runs in that many worker processes (see tts_service.py),
+# so synthesis doesn't compete with the agents and Flask for the GIL. Each worker loads its own copy of the models.
+TTS_WORKER_PROCESSES = 0
+# Each agent's prompt is kept under this many tokens. The newest CONTEXT_KEEP_RECENT messages are always sent word for word,
+# and older ones are summarized in the background. Keep the budget well under the model's context size (num_ctx).
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_KEEP_RECENT = 12
+# Speculative mode: when an agent finishes its reply, the candidate next speakers all draft a reply at the same time,
+# and whoever finishes first speaks next. This hides the LLM time of the next speaker behind the current agent's audio.
+SPECULATIVE_DRAFTS = False
+SPECULATIVE_TOP_K = 2  # How many candidates draft each round (None = every other agent)
+SPECULATIVE_MAX_CONCURRENCY = 2  # Max drafts generating at once, keep this <= the number of Ollama parallel slots
+# Every message is appended to this log once, as one JSON line (see conversation_log.py)
+CONVERSATION_LOG_FILE = "backup_history/conversation.jsonl"
+# At startup, move all but this many of the newest messages out to backup_history/conversation.archive.jsonl. None = keep everything.
+CONVERSATION_LOG_KEEP = None
+# At startup, refill every agent's context with the end of the conversation log, so the conversation carries on where it stopped.
+# Only the newest messages that fit in CONTEXT_TOKEN_BUDGET are read, however long the log is. False = start a fresh conversation.
+RESUME_CONVERSATION = True
 HUMAN_NAME = "HUMAN"  # Change to your preferred human name
+AGENTS_CONFIG_FILE = "agents.json"  # The agents in the conversation, see agent_config.py
+STREAM_RESPONSES = True  # Stream replies from Ollama and start TTS sentence by sentence, instead of waiting for the whole reply
+# Voice mode: transcribe the mic while the human is still talking (see streaming_asr.py), so the transcript is ready
+# right after num 8 is released, instead of transcribing the whole recording only after it ends
+WHISPER_STREAMING = True
+# Voice mode: stop recording on its own after this many seconds of silence once you've said something (hands-free).
+# None = only num 8 stops the recording. Silence before and after the speech is trimmed off before transcribing either way.
+VOICE_END_ON_SILENCE = None
+# Voice mode: recordings go from the mic to Whisper in memory. True also keeps a copy of each one in audio_in/.
+VOICE_SAVE_RECORDINGS = False
+# Whisper model for voice mode: "tiny", "base", "small", "medium", "large-v3", or an English-only ".en" version (e.g. "base.en").
+# None = large-v3 on a GPU, small.en on CPU. Run benchmarks/bench_whisper.py to see how fast each one is on this machine.
+WHISPER_MODEL_SIZE = None
+WHISPER_QUANTIZE = None  # int8 linear layers, only on CPU. None = on whenever Whisper runs on the CPU.
 
 # Human mode switching globals
 active_human_mode = "text"  # or "voice"
@@ -109,41 +187,96 @@ human_mode_lock = threading.Lock()
 current_human_thread = None
 current_human_agent = None
 
-def query_ollama(prompt):
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
-    try:
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("response", "")
-    except Exception as e:
-        print(f"Ollama API error: {e}")
-        return "Sorry, I could not get a response from the LLM."
-
-def start_ollama_server():
+if not TTS_CACHE:
+    tts_registry.cache = None
+
+# One client is shared by every agent, so they all reuse the same pool of keep-alive connections to Ollama
+ollama_client = OllamaClient(OLLAMA_HOST, model=OLLAMA_MODEL, read_timeout=OLLAMA_READ_TIMEOUT, keep_alive=OLLAMA_KEEP_ALIVE)
+ollama_residency = ModelResidency(ollama_client, [OLLAMA_MODEL], options=OLLAMA_OPTIONS)
+conversation_log = ConversationLog(CONVERSATION_LOG_FILE)
+# The conversation in memory, stored once and shared by every agent. Each agent reads it through its own view (see message_store.py).
+message_store = MessageStore()
+speculative_drafter = SpeculativeDrafter(lambda agent, messages, cancel_event: agent.draft_reply(messages, cancel_event),
+                                         max_concurrency=SPECULATIVE_MAX_CONCURRENCY, top_k=SPECULATIVE_TOP_K)
+
+# Called by the drafter with the first finished draft. That agent speaks next using its draft.
+def activate_with_draft(agent, text, history_version):
+    if turn_scheduler.paused or shutdown_event.is_set():
+        print(f"[yellow]Discarding {agent.name}'s draft because the agents are paused.")
+        return
+    print(f"[cyan]{agent.name} finished drafting first, activating them next.")
+    agent.pending_draft = (text, history_version)
+    turn_scheduler.request_turn(agent)
+
+# Writes a message to the conversation log and the shared message store once, and adds it to every agent's LLM context.
+# The speaker sees their own message as "assistant", everyone else sees it as "[NAME] message". Call with the conversation lock held.
+def share_message(speaker_name, content, all_agents):
+    conversation_log.append(speaker_name, content)
+    index = message_store.append(speaker_name, content)
+    for agent in all_agents:
+        agent.context.append(agent.history[index], tokens=agent.history.tokens(index))
+
+# Loads the end of the conversation log into the message store and every agent's context. Returns how many messages were loaded.
+# The log is read newest first through its offset index, and reading stops once the context budget is full,
+# so a session with a hundred thousand messages resumes as fast as one with a hundred.
+def resume_conversation(all_agents):
+    records = []
+    tokens = []
+    total_tokens = 0
+    for record in conversation_log.read_backwards():
+        records.append(record)
+        tokens.append(message_store.count_tokens(record["content"]))
+        total_tokens += tokens[-1]
+        if total_tokens >= CONTEXT_TOKEN_BUDGET and len(records) >= CONTEXT_KEEP_RECENT:
+            break
+    start = len(message_store)
+    for record, record_tokens in zip(reversed(records), reversed(tokens)):
+        message_store.append(record["speaker"], record["content"], timestamp=record.get("time"), tokens=record_tokens)
+    for agent in all_agents:
+        agent.context.restore([(agent.history[i], agent.history.tokens(i)) for i in range(start, len(message_store))])
+    return len(records)
+
+# Strips characters that Coqui TTS can't pronounce
+def clean_tts_text(text):
+    return ''.join(c for c in text if c.isascii() and c not in '*')
+
+def start_ollama_server(num_parallel=None):
+    # num_parallel: gives Ollama one cache slot per agent, so one agent's turn doesn't evict another agent's cached conversation
     print("[cyan]Attempting to start Ollama server...")
+    env = os.environ.copy()
+    if num_parallel:
+        env["OLLAMA_NUM_PARALLEL"] = str(num_parallel)
     if platform.system() == "Windows":
         try:
-            subprocess.Popen(["ollama", "serve"], creationflags=subprocess.DETACHED_PROCESS)
+            subprocess.Popen(["ollama", "serve"], creationflags=subprocess.DETACHED_PROCESS, env=env)
             print("[green]Ollama server started (Windows).")
         except Exception as e:
             print(f"Could not start Ollama server: {e}")
     else:
         try:
-            subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
             print("[green]Ollama server started (non-Windows).")
         except Exception as e:
             print(f"Could not start Ollama server: {e}")
 
 shutdown_event = threading.Event()
 
+# Tells every thread to stop, and wakes up any agents that are waiting for a turn
+def stop_all_threads():
+    shutdown_event.set()
+    turn_scheduler.shutdown()
+    ollama_residency.stop()
+    tts_registry.close()
+    audio_manager.close()
+    conversation_log.close()
+    if whisper_manager.loaded:
+        print(f"[blue]{whisper_manager.get().report()}")
+    if tts_registry.cache is not None:
+        print(f"[blue]{tts_registry.cache.report()}")
+
 def handle_shutdown(signum, frame):
     print("[yellow]Shutdown signal received. Exiting...")
-    shutdown_event.set()
+    stop_all_threads()
     # Attempt to stop Flask server
     try:
         socketio.stop()
@@ -183,11 +316,14 @@ def switch_human_mode(new_mode, all_agents):
         # Signal the current human agent to exit
         if current_human_agent:
             print("[yellow]Signaling current human agent to exit...")
-            # The run() loop will exit when mode changes
+            current_human_agent.stop()
         # Wait for the thread to finish
         if current_human_thread and current_human_thread.is_alive():
             current_human_thread.join(timeout=2)
         # Start the new human agent
+        if new_mode == "voice":
+            # Starts loading Whisper the first time, so it's (hopefully) ready by the time the human talks
+            whisper_manager.load_in_background()
         if new_mode == "text":
             current_human_agent = HumanText(f"{HUMAN_NAME}_TEXT", all_agents)
         else:
@@ -199,10 +335,9 @@ def switch_human_mode(new_mode, all_agents):
 # Class that represents a single AI Agent and its information
 class Agent():
     
-    def __init__(self, agent_name, agent_id, filter_name, all_agents, system_prompt, tts_voice, tts_model="tts_models/en/ljspeech/tacotron2-DDC"):
+    def __init__(self, agent_name, agent_id, filter_name, all_agents, system_prompt, tts_voice, tts_model="tts_models/en/ljspeech/tacotron2-DDC", llm_client=None,
+                 options=None, max_sentences=None):
         print(f"[blue]Initializing Agent: {agent_name} (ID: {agent_id}, Voice: {tts_voice}, Model: {tts_model})")
-        # Flag of whether this agent should begin speaking
-        self.activated = False 
         # Used to identify each agent in the conversation history
         self.name = agent_name 
         # an int used to ID this agent to the frontend code
@@ -212,132 +347,258 @@ class Agent():
         self.filter_name = filter_name 
         # A list of the other agents, so that you can pick one to randomly "activate" when you finish talking
         self.all_agents = all_agents
-        # The name of the txt backup file where this agent's conversation history will be stored
-        backup_file_name = f"backup_history/backup_history_{agent_name}.txt"
-        # Initialize the OpenAi manager with a system prompt and a file that you would like to save your conversation too
-        # If the backup file isn't empty, then it will restore that backed up conversation for this agent
+        # The conversation itself is saved once for everyone, in the conversation log (see share_message)
         self.system_prompt = f" Your real name is {self.name} " + system_prompt.get("content", "")
-        print(f"[blue]Agent {self.name} will save chat history to: {backup_file_name}")
         print(f"[blue]Agent {self.name} will use system prompt: {self.system_prompt}")
-        self.backup_file_name = backup_file_name
-        self.chat_history = [
-            {"role": "system", "content": self.system_prompt},
-        ]
+        # This agent's view of the shared conversation, with its own messages as "assistant" and everyone else's as "user"
+        self.history = message_store.view(self.name)
         self.tts_voice = tts_voice  # Store the TTS voice for the agent
-        from coqui_tts_manager import CoquiTTSManager
-        self.coqui_manager = CoquiTTSManager(model_name=tts_model)
+        # A handle on the shared TTS model, so agents using the same model don't each load their own copy
+        # The model itself is loaded in the background at startup (or by the first synthesis)
+        self.tts = tts_registry.acquire(tts_model, speaker=tts_voice, load=False)
+        # The last full reply from this agent, shown on the frontend once its audio has played
+        self.last_spoken = ""
+        self.messages_shown = 0  # So a delayed clear doesn't hide a newer message
+        # The Ollama client used for replies (defaults to the shared client)
+        self.llm_client = llm_client or ollama_client
+        # Generation options for this agent's replies, e.g. num_predict and stop sequences, on top of OLLAMA_OPTIONS
+        self.options = {**OLLAMA_OPTIONS, **(options or {})}
+        # Replies are cut off after this many sentences (None = no limit). When streaming, generation stops right there,
+        # instead of Ollama writing a paragraph nobody will hear.
+        self.max_sentences = max_sentences
+        # A reply drafted ahead of time in speculative mode: (text, len(history) when the draft was started)
+        self.pending_draft = None
+        # What actually gets sent to the LLM: the system prompt, a summary of older messages, and the recent messages
+        self.context = AgentContext(self.system_prompt, token_budget=CONTEXT_TOKEN_BUDGET, keep_recent=CONTEXT_KEEP_RECENT,
+                                    summarize=self.summarize_messages, name=self.name)
+
+    # Flattened prompt for /api/generate. The recent messages come from the view's rendered lines, so each one is only rendered once.
+    def build_prompt(self):
+        header = self.context.messages()[:-self.context.recent_count or None]
+        recent = self.history.rendered_lines(len(self.history) - self.context.recent_count)
+        return '\n'.join([str(msg["content"]) for msg in header] + recent)
 
-    def save_chat_to_backup(self):
-        with open(self.backup_file_name, "w", encoding="utf-8") as file:
-            file.write(str(self.chat_history))
+    def request_reply(self):
+        if OLLAMA_USE_CHAT:
+            return self.llm_client.chat(self.context.messages(), options=self.options)
+        return self.llm_client.generate(self.build_prompt(), options=self.options)
+
+    def request_reply_stream(self):
+        if OLLAMA_USE_CHAT:
+            return self.llm_client.chat_stream(self.context.messages(), options=self.options)
+        return self.llm_client.generate_stream(self.build_prompt(), options=self.options)
+
+    # Writes a reply against a snapshot of the messages, for speculative mode. Returns None if cancelled partway.
+    def draft_reply(self, messages, cancel_event):
+        if OLLAMA_USE_CHAT:
+            stream = self.llm_client.chat_stream(messages, options=self.options)
+        else:
+            stream = self.llm_client.generate_stream('\n'.join([str(msg["content"]) for msg in messages]), options=self.options)
+        parts = []
+        splitter = SentenceSplitter()
+        sentence_count = 0
+        try:
+            for chunk in stream:
+                if cancel_event.is_set() or shutdown_event.is_set():
+                    return None
+                parts.append(chunk)
+                sentence_count += len(splitter.feed(chunk))
+                if self.max_sentences and sentence_count >= self.max_sentences:
+                    break
+        finally:
+            # Closes the HTTP stream, which makes Ollama stop generating
+            stream.close()
+        return ''.join(parts)
+
+    # Returns the pending draft if nothing has been added to the history since it was started, otherwise None
+    def take_draft(self):
+        draft, self.pending_draft = self.pending_draft, None
+        if draft is None:
+            return None
+        text, history_version = draft
+        if history_version != len(self.history):
+            print(f"[yellow]{self.name}'s draft is out of date, generating a new reply.")
+            return None
+        return text
+
+    # Used by AgentContext on its background thread to fold old messages into the running summary
+    def summarize_messages(self, previous_summary, messages):
+        prompt = summary_prompt(self.name, previous_summary, messages)
+        return self.llm_client.generate(prompt, options={**OLLAMA_OPTIONS, "num_predict": 400})
+
+    # Returns an AudioBuffer in memory mode, otherwise the path of the audio file
+    def synthesize_speech(self, text):
+        if not TTS_IN_MEMORY:
+            return self.tts.text_to_audio(text, save_as_wave=True)
+        audio = self.tts.synthesize(text)
+        if TTS_ARCHIVE_AUDIO:
+            os.makedirs("audio_msg", exist_ok=True)
+            audio.write(f"audio_msg/{self.name}_{int(time.time() * 1000)}.wav")
+        return audio
+
+    # Returns False if the human skipped it (F9)
+    def play_speech(self, audio):
+        # OBS Integration: Activate move filter on the image (uncomment to enable)
+        # obswebsockets_manager.set_filter_visibility("Line In", self.filter_name, True)
+        if isinstance(audio, AudioBuffer):
+            return audio_manager.play_buffer(audio)
+        return audio_manager.play_audio(audio, True, False, True)
+
+    # Builds a pipeline that synthesizes each sentence as soon as it is submitted and plays them in order under the speaking lock
+    def create_speech_pipeline(self):
+        def synthesize(sentence):
+            print(f"[blue]{self.name} generating TTS for sentence with voice '{self.tts_voice}'...")
+            return self.synthesize_speech(sentence)
+        return SpeechPipeline(synthesize, self.play_speech, speaking_lock, on_finished=self.show_message, stop_event=shutdown_event, name=self.name)
+
+    # Sends this agent's latest reply to the frontend. Called while holding the speaking lock, so it returns right away
+    # and the message is cleared from the frontend later on a timer, instead of making the next speaker wait.
+    def show_message(self):
+        socketio.emit('start_agent', {'agent_id': self.agent_id})
+        socketio.emit('agent_message', {'agent_id': self.agent_id, 'text': self.last_spoken})
+        self.messages_shown += 1
+        timer = threading.Timer(1.0, self.clear_message, args=(self.messages_shown,))
+        timer.daemon = True
+        timer.start()
+
+    def clear_message(self, message_number):
+        if message_number != self.messages_shown:
+            return
+        socketio.emit('clear_agent', {'agent_id': self.agent_id})
+        # OBS Integration: Turn off the filter (uncomment to enable)
+        # obswebsockets_manager.set_filter_visibility("Line In", self.filter_name, False)
 
     def run(self):
         print(f"[blue]Agent thread started: {self.name}")
         while not shutdown_event.is_set():
-            # Wait until we've been activated
-            if not self.activated:
-                time.sleep(0.1)
-                continue
-            self.activated = False
+            # Sleep until the scheduler gives us a turn (by the human or by another agent)
+            if not turn_scheduler.wait_for_turn(self):
+                break
             print(f"[italic purple] {self.name} has STARTED speaking.")
             with conversation_lock:
                 print(f"[grey]({self.name}) Acquired conversation lock.")
-                prompt = '\n'.join([str(msg["content"]) for msg in self.chat_history])
-                response = query_ollama(prompt)
+                pipeline = None
+                sentences = []
+                ollama_failed = False
+                draft = self.take_draft()
+                try:
+                    if STREAM_RESPONSES:
+                        # Each sentence goes to TTS the moment it's complete, so audio can start before the reply is finished
+                        pipeline = self.create_speech_pipeline()
+                        splitter = SentenceSplitter()
+                        response_parts = []
+                        stopped_early = False
+                        chunks = [draft] if draft is not None else self.request_reply_stream()
+                        try:
+                            for chunk in chunks:
+                                if shutdown_event.is_set():
+                                    break
+                                response_parts.append(chunk)
+                                for sentence in splitter.feed(chunk):
+                                    if not self.max_sentences or len(sentences) < self.max_sentences:
+                                        sentences.append(sentence)
+                                        self.submit_sentence(pipeline, sentence)
+                                if self.max_sentences and len(sentences) >= self.max_sentences:
+                                    print(f"[grey]({self.name}) Reached {self.max_sentences} sentences, stopping the reply there.")
+                                    stopped_early = True
+                                    break
+                            else:
+                                for sentence in splitter.flush():
+                                    sentences.append(sentence)
+                                    self.submit_sentence(pipeline, sentence)
+                        finally:
+                            # Closes the HTTP stream if we stopped early, which makes Ollama stop generating
+                            if hasattr(chunks, "close"):
+                                chunks.close()
+                        # The history gets what was actually said, not the part that was cut off
+                        response = ' '.join(sentences) if stopped_early else ''.join(response_parts)
+                    else:
+                        response = draft if draft is not None else self.request_reply()
+                        response = limit_sentences(response, self.max_sentences)
+                except OllamaError as e:
+                    # Don't put an apology into everyone's history. End this turn and leave the conversation waiting for the human.
+                    print(f"[red]{self.name} could not get a response from Ollama: {e}")
+                    print("[red]Conversation stopped. Activate an agent again once Ollama is back up.")
+                    if not sentences:
+                        if pipeline:
+                            pipeline.close()
+                        continue
+                    # These sentences already went to TTS and will be spoken, so they go into everyone's history too
+                    response = ' '.join(sentences)
+                    ollama_failed = True
                 if shutdown_event.is_set():
                     print(f"[yellow]{self.name} aborting after LLM due to shutdown.")
+                    if pipeline:
+                        pipeline.close()
                     break
                 spoken = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
                 print(f'[magenta]Got the following response:\n{spoken}')
-                for agent in self.all_agents:
-                    if agent is not self:
-                        agent.chat_history.append({"role": "user", "content": f"[{self.name}] {spoken}"})
-                        agent.save_chat_to_backup()
-                self.chat_history.append({"role": "assistant", "content": spoken})
-                self.save_chat_to_backup()
+                self.last_spoken = spoken
+                if pipeline:
+                    pipeline.close()
+                share_message(self.name, spoken, self.all_agents)
             # --- Activate next agent immediately after LLM, before TTS ---
-            if not agents_paused:
+            if not turn_scheduler.paused and not ollama_failed:
                 other_agents = [agent for agent in self.all_agents if agent is not self]
-                if other_agents:
+                if other_agents and SPECULATIVE_DRAFTS:
+                    speculative_drafter.start_round(other_agents, activate_with_draft)
+                elif other_agents:
                     random_agent = random.choice(other_agents)
                     print(f"[cyan]{self.name} activating next agent: {random_agent.name}")
-                    random_agent.activated = True
+                    turn_scheduler.request_turn(random_agent)
                 else:
                     print(f"[yellow]{self.name} is the only agent, no one else to activate.")
-            # --- Now do TTS and audio playback, which will block on speaking_lock ---
-            import unicodedata
-            def clean_tts_text(text):
-                return ''.join(c for c in text if c.isascii() and c not in '*')
-            cleaned_spoken = clean_tts_text(spoken)
-            if len(cleaned_spoken.strip()) < 5:
-                print(f'[yellow]Skipping TTS for very short or empty sentence. ({self.name})')
-            else:
+            if pipeline is None:
+                # Non-streaming mode: the whole reply is here, but it's still split into sentences,
+                # so the first sentence starts playing while the rest are being synthesized
                 if shutdown_event.is_set():
                     print(f"[yellow]{self.name} aborting before TTS due to shutdown.")
                     break
-                try:
-                    print(f"[blue]{self.name} generating TTS with voice '{self.tts_voice}' and model '{self.coqui_manager.tts.model_name}'...")
-                    tts_file = self.coqui_manager.text_to_audio(cleaned_spoken, save_as_wave=True, speaker=self.tts_voice)
-                    print(f"[green]{self.name} TTS audio generated: {tts_file}")
-                except Exception as e:
-                    print(f"[red]TTS failed or interrupted: {e}")
-                    break
-                with speaking_lock:
-                    print(f"[grey]({self.name}) Acquired speaking lock.")
-                    if shutdown_event.is_set():
-                        print(f"[yellow]{self.name} aborting speech due to shutdown.")
-                        break
-                    try:
-                        # OBS Integration: Activate move filter on the image (uncomment to enable)
-                        # obswebsockets_manager.set_filter_visibility("Line In", self.filter_name, True)
-                        
-                        print(f"[blue]{self.name} playing audio...")
-                        audio_manager.play_audio(tts_file, False, False, True)
-                        print(f"[green]{self.name} finished audio playback.")
-                    except Exception as e:
-                        print(f"[red]Audio playback interrupted or failed: {e}")
-                        break
-                    if shutdown_event.is_set():
-                        print(f"[yellow]{self.name} aborting after speech due to shutdown.")
-                        break
-                    socketio.emit('start_agent', {'agent_id': self.agent_id})
-                    socketio.emit('agent_message', {'agent_id': self.agent_id, 'text': spoken})
-                    time.sleep(1)
-                    socketio.emit('clear_agent', {'agent_id': self.agent_id})
-                    time.sleep(1)
-                    
-                    # OBS Integration: Turn off the filter (uncomment to enable)
-                    # obswebsockets_manager.set_filter_visibility("Line In", self.filter_name, False)
-                    
+                pipeline = self.create_speech_pipeline()
+                splitter = SentenceSplitter()
+                for sentence in splitter.feed(spoken) + splitter.flush():
+                    self.submit_sentence(pipeline, sentence)
+                pipeline.close()
+            # The pipeline is synthesizing/playing, just wait for it to finish
+            pipeline.join()
             print(f"[italic purple] {self.name} has FINISHED speaking.")
         print(f"[yellow]{self.name} thread exiting due to shutdown.")
 
+    def submit_sentence(self, pipeline, sentence):
+        cleaned_sentence = clean_tts_text(sentence)
+        if len(cleaned_sentence.strip()) < 5:
+            print(f'[yellow]Skipping TTS for very short or empty sentence. ({self.name})')
+            return
+        pipeline.submit(cleaned_sentence)
+
 
 # Class that handles human input, this thread is how you can manually activate or pause the other agents
 class HumanText():
     def __init__(self, name, all_agents):
         self.name = name
         self.all_agents = all_agents
-        self.chat_history = [
-            {"role": "system", "content": "You are the human participant in this conversation (text mode)."},
-        ]
+        # Set when the human switches to a different mode, so this thread exits
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        # input() can't be interrupted, so the thread exits after the next line is entered
+        self.stop_event.set()
+
     def run(self):
         print(f"[blue]HumanText thread started: {self.name}")
-        global agents_paused, active_human_mode
-        while not shutdown_event.is_set():
-            if active_human_mode != "text":
-                time.sleep(0.1)
-                continue
+        while not shutdown_event.is_set() and not self.stop_event.is_set():
             try:
                 print("[blue]Waiting for your input (type 'exit' to quit)...")
                 user_input = input("You: ")
             except (KeyboardInterrupt, EOFError):
                 print("[yellow]Exiting chat (KeyboardInterrupt).")
-                shutdown_event.set()
+                stop_all_threads()
+                break
+            if self.stop_event.is_set():
                 break
             if user_input.strip().lower() == 'exit':
                 print("[yellow]Exiting chat.")
-                shutdown_event.set()
+                stop_all_threads()
                 if platform.system() == "Windows":
                     print("[yellow]Killing Ollama processes (Windows)...")
                     subprocess.run(["taskkill", "/IM", "ollama.exe", "/F"], shell=True)
@@ -350,102 +611,142 @@ class HumanText():
             if user_input.strip() == '':
                 print("[red]Did not receive any input!")
                 continue
+            # Any drafts in progress were written before this message, so throw them away
+            speculative_drafter.cancel()
             with conversation_lock:
                 print(f"[grey](HumanText) Acquired conversation lock.")
-                for agent in self.all_agents:
-                    agent.chat_history.append({"role": "user", "content": f"[{self.name}] {user_input}"})
-                    agent.save_chat_to_backup()
+                share_message(self.name, user_input, self.all_agents)
             print(f"[italic magenta] {self.name} has FINISHED speaking.")
-            agents_paused = False
             random_agent = random.randint(0, len(self.all_agents)-1)
             print(f"[cyan]Activating Agent {random_agent+1} ({self.all_agents[random_agent].name})")
-            self.all_agents[random_agent].activated = True
-            time.sleep(0.05)
+            turn_scheduler.activate(self.all_agents[random_agent])
         print("[yellow]HumanText thread exiting due to shutdown.")
 
 class HumanVoice():
+    # Hotkeys, and the action each one queues up for the run() loop
+    HOTKEYS = {
+        'num 7': "talk",
+        'f4': "pause",
+    }
+    # Agents 1-9 are activated with their number on the numpad (7 and 8 are still used for recording),
+    # and agents 1-12 can also be activated with ctrl+F1-F12
+    AGENT_HOTKEYS = ['num 1', 'num 2', 'num 3', 'num 4', 'num 5', 'num 6', None, None, 'num 9']
+
     def __init__(self, name, all_agents):
         self.name = name
         self.all_agents = all_agents
-        self.chat_history = [
-            {"role": "system", "content": "You are the human participant in this conversation (voice mode)."},
-        ]
+        # Key presses are pushed here by keyboard's listener thread, so run() can sleep until something happens
+        self.actions = queue.Queue()
+        self.hotkey_handles = []
+
+    def stop(self):
+        self.actions.put(None)
+
     def run(self):
         print(f"[blue]HumanVoice thread started: {self.name}")
-        global agents_paused, active_human_mode
-        while not shutdown_event.is_set():
-            if active_human_mode != "voice":
-                time.sleep(0.1)
-                continue
-            try:
-                # print("[blue]Waiting for your input (press 'num 7' to start voice input, 'f4' to pause agents, or 'num 1/2/3' to activate agents)...")
-                # Num 7: Start voice input (pause agents, record, transcribe, add to chat, resume, activate random agent)
-                if keyboard.is_pressed('num 7'):
-                    agents_paused = True
-                    print(f"[italic red] Agents have been paused")
-                    print(f"[italic green] {self.name} has STARTED speaking (voice input mode). Press 'num 8' to stop recording.")
-                    # Force mono channel for compatibility
-                    mic_audio = audio_manager.record_audio(end_recording_key='num 8', channels=1)
-                    with conversation_lock:
-                        transcribed_audio = whisper_manager.audio_to_text(mic_audio)
-                        print(f"[teal]Got the following audio from {self.name}:\n{transcribed_audio}")
-                        for agent in self.all_agents:
-                            agent.chat_history.append({"role": "user", "content": f"[{self.name}] {transcribed_audio}"})
-                            agent.save_chat_to_backup()
-                    print(f"[italic magenta] {self.name} has FINISHED speaking (voice input mode).")
-                    agents_paused = False
-                    random_agent = random.randint(0, len(self.all_agents)-1)
-                    print(f"[cyan]Activating Agent {random_agent+1} ({self.all_agents[random_agent].name})")
-                    self.all_agents[random_agent].activated = True
-                    time.sleep(1)
-                # F4: Pause all agents
-                elif keyboard.is_pressed('f4'):
-                    print("[italic red] Agents have been paused")
-                    agents_paused = True
-                    time.sleep(1)
-                # Num 1: Activate Agent 1
-                elif keyboard.is_pressed('num 1'):
-                    print("[cyan]Activating Agent 1")
-                    agents_paused = False
-                    self.all_agents[0].activated = True
-                    time.sleep(1)
-                # Num 2: Activate Agent 2
-                elif keyboard.is_pressed('num 2'):
-                    print("[cyan]Activating Agent 2")
-                    agents_paused = False
-                    self.all_agents[1].activated = True
-                    time.sleep(1)
-                # Num 3: Activate Agent 3
-                elif keyboard.is_pressed('num 3'):
-                    print("[cyan]Activating Agent 3")
-                    agents_paused = False
-                    self.all_agents[2].activated = True
-                    time.sleep(1)
-                else:
-                    time.sleep(0.05)
-            except Exception as e:
-                print(f"[red]Error in HumanVoice input thread: {e}")
-                time.sleep(0.1)
+        hotkeys = dict(self.HOTKEYS)
+        for i in range(len(self.all_agents)):
+            if i < len(self.AGENT_HOTKEYS) and self.AGENT_HOTKEYS[i]:
+                hotkeys[self.AGENT_HOTKEYS[i]] = i
+            if i < 12:
+                hotkeys[f'ctrl+f{i+1}'] = i
+        # trigger_on_release means holding a key down only fires once
+        for hotkey, action in hotkeys.items():
+            self.hotkey_handles.append(keyboard.add_hotkey(hotkey, self.actions.put, args=(action,), trigger_on_release=True))
+        try:
+            while not shutdown_event.is_set():
+                action = self.actions.get()
+                if action is None or shutdown_event.is_set():
+                    break
+                try:
+                    self.handle_action(action)
+                except Exception as e:
+                    print(f"[red]Error in HumanVoice input thread: {e}")
+        finally:
+            for handle in self.hotkey_handles:
+                keyboard.remove_hotkey(handle)
         print("[yellow]HumanVoice thread exiting due to shutdown.")
 
+    def handle_action(self, action):
+        # Num 7: Start voice input (pause agents, record, transcribe, add to chat, resume, activate random agent)
+        if action == "talk":
+            turn_scheduler.pause()
+            speculative_drafter.cancel()
+            print(f"[italic green] {self.name} has STARTED speaking (voice input mode). Press 'num 8' to stop recording.")
+            transcriber = None
+            if WHISPER_STREAMING:
+                if whisper_manager.loaded:
+                    transcriber = StreamingTranscriber(whisper_manager.get())
+                else:
+                    print("[yellow]Whisper is still loading, this recording will be transcribed once it ends.")
+            # Force mono channel for compatibility
+            mic_audio = audio_manager.record_audio(end_recording_key='num 8', channels=1,
+                                                   on_chunk=transcriber.feed if transcriber else None, end_on_silence=VOICE_END_ON_SILENCE,
+                                                   as_array=True, save_file=VOICE_SAVE_RECORDINGS)
+            recording_stopped = time.perf_counter()
+            with conversation_lock:
+                if transcriber:
+                    transcribed_audio = transcriber.finish()
+                else:
+                    transcribed_audio = whisper_manager.get().audio_to_text(mic_audio)
+                print(f"[grey]Transcript was ready {time.perf_counter() - recording_stopped:.2f}s after the recording stopped.")
+                print(f"[teal]Got the following audio from {self.name}:\n{transcribed_audio}")
+                share_message(self.name, transcribed_audio, self.all_agents)
+            print(f"[italic magenta] {self.name} has FINISHED speaking (voice input mode).")
+            random_agent = random.randint(0, len(self.all_agents)-1)
+            print(f"[cyan]Activating Agent {random_agent+1} ({self.all_agents[random_agent].name})")
+            turn_scheduler.activate(self.all_agents[random_agent])
+        # F4: Pause all agents
+        elif action == "pause":
+            turn_scheduler.pause()
+            speculative_drafter.cancel()
+        # Num 1-9 / ctrl+F1-F12: Activate that agent
+        elif action < len(self.all_agents):
+            print(f"[cyan]Activating Agent {action+1}")
+            speculative_drafter.cancel()
+            turn_scheduler.activate(self.all_agents[action])
+
 if __name__ == '__main__':
     print("[bold blue]Starting Multi-Agent GPT Characters...")
-    start_ollama_server()
-    time.sleep(2)
+    # Edit agents.json to change the number of AIs in the conversation, their prompts and their voices
+    with startup.step("read agents"):
+        agent_configs = load_agent_configs(AGENTS_CONFIG_FILE)
+    NUM_AGENTS = len(agent_configs)
+    if CONVERSATION_LOG_KEEP is not None:
+        with startup.step("compact conversation log"):
+            conversation_log.compact(keep_last=CONVERSATION_LOG_KEEP)
+    with startup.step("start ollama serve"):
+        start_ollama_server(num_parallel=NUM_AGENTS)
+    # Everything slow happens in the background at the same time: Ollama starting up, and each TTS model loading
+    ollama_ready = startup.background("wait for Ollama", ollama_client.wait_until_ready)
+    # Loads the LLM into Ollama now, instead of on the first agent's turn
+    def preload_ollama_model():
+        ollama_ready.result()
+        ollama_residency.preload()
+        ollama_residency.start()
+    ollama_loaded = startup.background(f"Ollama model {OLLAMA_MODEL}", preload_ollama_model)
+    if TTS_WORKER_PROCESSES:
+        with startup.step("start TTS workers"):
+            tts_registry.use_service(TTSService(num_workers=TTS_WORKER_PROCESSES))
+    model_loads = [startup.background(f"TTS model {model_name}", tts_registry.preload, model_name)
+                   for model_name in dict.fromkeys(config["tts_model"] for config in agent_configs)]
+    if active_human_mode == "voice":
+        whisper_manager.load_in_background()
     all_agents = []
-    NUM_AGENTS = 3  # Change this to set the number of AIs in the conversation
-    agent_configs = [
-        ("OSWALD", 1, "Audio Move - Wario Pepper", VIDEOGAME_AGENT_1, "p241"),
-        ("TONY KING OF NEW YORK", 2, "Audio Move - Waluigi Pepper", VIDEOGAME_AGENT_2, "p267"),
-        ("VICTORIA", 3, "Audio Move - Gamer Pepper", VIDEOGAME_AGENT_3, "p243"),
-    ]
     agent_threads = []
-    for i in range(NUM_AGENTS):
-        name, agent_id, filter_name, system_prompt, tts_voice = agent_configs[i]
-        agent = Agent(name, agent_id, filter_name, all_agents, system_prompt, tts_voice, tts_model="tts_models/en/vctk/vits")
+    with startup.step("create agents"):
+        for config in agent_configs:
+            agent = Agent(config["name"], config["agent_id"], config["filter_name"], all_agents, config["system_prompt"], config["tts_voice"], tts_model=config["tts_model"],
+                          options=config["options"], max_sentences=config["max_sentences"])
+            all_agents.append(agent)
+    if RESUME_CONVERSATION:
+        with startup.step("resume conversation"):
+            resumed = resume_conversation(all_agents)
+        if resumed:
+            print(f"[green]Resumed the conversation: loaded the last {resumed} of {len(conversation_log)} messages from {CONVERSATION_LOG_FILE}.")
+    for agent in all_agents:
         thread = threading.Thread(target=start_bot, args=(agent,))
         agent_threads.append(thread)
-        all_agents.append(agent)
         thread.start()
     # Start with only the selected human agent
     if active_human_mode == "text":
@@ -454,13 +755,20 @@ if __name__ == '__main__':
         current_human_agent = HumanVoice(f"{HUMAN_NAME}_VOICE", all_agents)
     current_human_thread = threading.Thread(target=start_bot, args=(current_human_agent,))
     current_human_thread.start()
+    # Failures were already printed by the profiler. The agents retry Ollama on their turn, and TTS models load on first use.
+    for future in [ollama_ready, ollama_loaded] + model_loads:
+        try:
+            future.result()
+        except Exception:
+            pass
+    print(f"[blue]{startup.report()}")
     print("[italic green]!!AGENTS ARE READY TO GO!!\nType your message and press Enter, or use voice/keys if in voice mode. Type 'exit' to quit.")
     try:
         print("[blue]Starting Flask-SocketIO server...")
         socketio.run(app)
     except KeyboardInterrupt:
         print("[yellow]Flask server interrupted.")
-        shutdown_event.set()
+        stop_all_threads()
     print("[blue]Waiting for all threads to exit...")
     for thread in agent_threads:
         thread.join()
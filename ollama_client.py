@@ -0,0 +1,363 @@
+# OllamaClient: Shared HTTP client for talking to a local Ollama server
+# Keeps a pool of keep-alive connections open, so every turn doesn't pay for a new TCP connection.
+# Every request has a connect and read timeout, so a stalled Ollama can't hang an agent thread forever.
+# Failed requests are retried a few times with exponential backoff, and after too many failures in a row
+# the circuit breaker "opens" and fails fast for a cooldown period, instead of piling up slow timeouts.
+# ModelResidency loads the model into Ollama at startup and keeps it loaded, so no turn pays for loading it.
+import json
+import time
+import random
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from rich import print
+
+# Context size sent with every request by both runtimes. It has to be the same for every request (preload, replies, summaries),
+# or Ollama reloads the model to change it, and at least the agents' token budget, or the start of long prompts is silently cut off.
+DEFAULT_NUM_CTX = 8192
+
+class OllamaError(Exception):
+    pass
+
+class CircuitOpenError(OllamaError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed: requests go through normally
+    open: too many failures in a row, requests fail immediately until reset_timeout has passed
+    half-open: after the timeout, one trial request is let through. Success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self):
+        with self.lock:
+            if self._state() == "open":
+                remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+                raise CircuitOpenError(f"Ollama circuit is open after {self.failures} failures, retrying in {remaining:.0f}s")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # Either we hit the threshold, or a half-open trial request failed
+                self.opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """
+    Parameters:
+    base_url (str): root url of the Ollama server, e.g. "http://localhost:11434"
+    model (str): default model used when a call doesn't specify one
+    connect_timeout (float): seconds to wait for the TCP connection
+    read_timeout (float): seconds to wait between bytes from the server. When streaming this is per chunk, not for the whole reply.
+    max_retries (int): how many times a failed request is retried before giving up
+    backoff (float): base delay for exponential backoff between retries (doubles each attempt, plus jitter)
+    pool_size (int): max keep-alive connections kept open, should be >= the number of agents
+    keep_alive (str or int): sent with every request, how long Ollama keeps the model loaded afterwards (e.g. "30m", -1 = forever).
+                             None uses Ollama's default (5 minutes).
+    """
+
+    def __init__(self, base_url="http://localhost:11434", model=None, connect_timeout=3.05, read_timeout=120.0,
+                 max_retries=2, backoff=0.5, pool_size=10, failure_threshold=5, reset_timeout=30.0, keep_alive=None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # requests.Session is safe to share between threads for simple request/response use
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def wait_until_ready(self, timeout=60.0, interval=0.25):
+        # Polls the server until it answers (e.g. right after starting `ollama serve`) and returns how many seconds that took.
+        # Doesn't count towards the circuit breaker, since a server that's still starting up isn't failing.
+        start = time.monotonic()
+        while True:
+            try:
+                self.session.get(self.base_url + "/api/version", timeout=(self.timeout[0], 5)).raise_for_status()
+                return time.monotonic() - start
+            except requests.RequestException as e:
+                if time.monotonic() - start + interval > timeout:
+                    raise OllamaError(f"Ollama at {self.base_url} wasn't ready after {timeout:.0f}s: {e}") from e
+                time.sleep(interval)
+
+    def preload(self, model=None, options=None):
+        # A request with no prompt makes Ollama load the model (and reset its keep_alive timer) without generating anything.
+        # options should have the same num_ctx as the real requests, or Ollama reloads the model for the first one.
+        payload = {"model": model or self.model}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return self._post_json("/api/generate", payload)
+
+    def running_models(self):
+        # Names of the models Ollama currently has loaded
+        response = self.session.get(self.base_url + "/api/ps", timeout=self.timeout)
+        response.raise_for_status()
+        return [model["name"] for model in response.json().get("models", [])]
+
+    # Returns the full reply text from /api/generate
+    # Set raw=True to get Ollama's whole response instead, which includes timing stats like prompt_eval_count
+    def generate(self, prompt, model=None, options=None, raw=False):
+        data = self._post_json("/api/generate", self._payload("prompt", prompt, model, options, stream=False))
+        return data if raw else data.get("response", "")
+
+    # Yields the reply from /api/generate chunk by chunk as it's generated
+    def generate_stream(self, prompt, model=None, options=None):
+        for data in self._post_stream("/api/generate", self._payload("prompt", prompt, model, options, stream=True)):
+            chunk = data.get("response", "")
+            if chunk:
+                yield chunk
+
+    # Returns the reply to a list of {"role", "content"} messages from /api/chat
+    # Because the messages are sent as-is, and each new turn only appends to the end, Ollama can reuse the KV cache
+    # for the whole previous conversation and only prefill the new messages
+    def chat(self, messages, model=None, options=None, raw=False):
+        data = self._post_json("/api/chat", self._payload("messages", messages, model, options, stream=False))
+        return data if raw else data.get("message", {}).get("content", "")
+
+    # Yields the reply from /api/chat chunk by chunk as it's generated
+    def chat_stream(self, messages, model=None, options=None):
+        for data in self._post_stream("/api/chat", self._payload("messages", messages, model, options, stream=True)):
+            chunk = data.get("message", {}).get("content", "")
+            if chunk:
+                yield chunk
+
+    def _payload(self, input_key, value, model, options, stream):
+        payload = {"model": model or self.model, input_key: value, "stream": stream}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    # Yields each decoded NDJSON object from a streaming endpoint
+    # Only retries if the failure happened before anything was received, otherwise the caller would get duplicated text
+    def _post_stream(self, path, payload):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            received = False
+            try:
+                with self.session.post(self.base_url + path, json=payload, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        if "error" in data:
+                            raise OllamaError(data["error"])
+                        received = True
+                        yield data
+                        if data.get("done"):
+                            break
+                self.breaker.record_success()
+                return
+            except (requests.RequestException, ValueError, OllamaError) as e:
+                self.breaker.record_failure()
+                if received or attempt == self.max_retries:
+                    raise OllamaError(f"Ollama stream failed: {e}") from e
+                self._sleep_before_retry(attempt, e)
+
+    def _post_json(self, path, payload):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            try:
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+                self.breaker.record_success()
+                return data
+            except (requests.RequestException, ValueError) as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise OllamaError(f"Ollama request to {path} failed after {attempt + 1} attempts: {e}") from e
+                self._sleep_before_retry(attempt, e)
+
+    def _sleep_before_retry(self, attempt, error):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+        print(f"[yellow]Ollama request failed ({error}), retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+
+class AsyncOllamaClient:
+    """
+    asyncio version of OllamaClient, with the same timeouts, retries and circuit breaker.
+    Uses aiohttp, which is only imported when this class is used.
+    Create it from inside a running event loop, and call close() when done.
+    """
+
+    def __init__(self, base_url="http://localhost:11434", model=None, connect_timeout=3.05, read_timeout=120.0,
+                 max_retries=2, backoff=0.5, pool_size=10, failure_threshold=5, reset_timeout=30.0, keep_alive=None):
+        import aiohttp
+        self.aiohttp = aiohttp
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size), timeout=self.timeout)
+
+    async def close(self):
+        await self.session.close()
+
+    async def generate(self, prompt, model=None, options=None, raw=False):
+        data = await self._post_json("/api/generate", self._payload("prompt", prompt, model, options, stream=False))
+        return data if raw else data.get("response", "")
+
+    async def generate_stream(self, prompt, model=None, options=None):
+        async for data in self._post_stream("/api/generate", self._payload("prompt", prompt, model, options, stream=True)):
+            chunk = data.get("response", "")
+            if chunk:
+                yield chunk
+
+    async def chat(self, messages, model=None, options=None, raw=False):
+        data = await self._post_json("/api/chat", self._payload("messages", messages, model, options, stream=False))
+        return data if raw else data.get("message", {}).get("content", "")
+
+    async def chat_stream(self, messages, model=None, options=None):
+        async for data in self._post_stream("/api/chat", self._payload("messages", messages, model, options, stream=True)):
+            chunk = data.get("message", {}).get("content", "")
+            if chunk:
+                yield chunk
+
+    def _payload(self, input_key, value, model, options, stream):
+        payload = {"model": model or self.model, input_key: value, "stream": stream}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    async def _post_json(self, path, payload):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            try:
+                async with self.session.post(self.base_url + path, json=payload) as response:
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+                self.breaker.record_success()
+                return data
+            except (self.aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise OllamaError(f"Ollama request to {path} failed after {attempt + 1} attempts: {e}") from e
+                await self._sleep_before_retry(attempt, e)
+
+    async def _post_stream(self, path, payload):
+        # Yields each decoded NDJSON object. Only retries if nothing was received yet.
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request()
+            received = False
+            try:
+                async with self.session.post(self.base_url + path, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        if "error" in data:
+                            raise OllamaError(data["error"])
+                        received = True
+                        yield data
+                        if data.get("done"):
+                            break
+                self.breaker.record_success()
+                return
+            except (self.aiohttp.ClientError, asyncio.TimeoutError, ValueError, OllamaError) as e:
+                self.breaker.record_failure()
+                if received or attempt == self.max_retries:
+                    raise OllamaError(f"Ollama stream failed: {e}") from e
+                await self._sleep_before_retry(attempt, e)
+
+    async def _sleep_before_retry(self, attempt, error):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+        print(f"[yellow]Ollama request failed ({error}), retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+
+
+class ModelResidency:
+    """
+    Keeps Ollama models loaded, so the first turn (and the first turn after a quiet period) doesn't pay for loading the model.
+    Parameters:
+    client (OllamaClient): its keep_alive is used for the preload requests
+    models (list): model names to keep loaded
+    options (dict): load options (num_ctx etc.), the same ones the agents send
+    refresh_interval (float): how often to check that every model is still loaded, and reload it if Ollama dropped it
+                              (e.g. to make room for another model). Keep it shorter than keep_alive. None = only preload once.
+    """
+
+    def __init__(self, client, models, options=None, refresh_interval=240.0):
+        self.client = client
+        self.models = list(dict.fromkeys(models))
+        self.options = options
+        self.refresh_interval = refresh_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def preload(self):
+        # Loads every model and returns how long each one took, in seconds
+        load_times = {}
+        for model in self.models:
+            start = time.perf_counter()
+            self.client.preload(model, self.options)
+            load_times[model] = time.perf_counter() - start
+            print(f"[green]Ollama model '{model}' is loaded ({load_times[model]:.1f}s).")
+        return load_times
+
+    def start(self):
+        if self.refresh_interval and self.thread is None:
+            self.thread = threading.Thread(target=self._refresh_loop, name="ollama-residency", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                running = self.client.running_models()
+                for model in self.models:
+                    # Ollama reports names with a tag, e.g. "gemma3n:e4b" or "llama3:latest"
+                    if model not in running and f"{model}:latest" not in running:
+                        print(f"[yellow]Ollama unloaded '{model}', loading it again...")
+                    # Refreshes keep_alive even if it's still loaded
+                    self.client.preload(model, self.options)
+            except (requests.RequestException, OllamaError) as e:
+                print(f"[yellow]Couldn't check which models Ollama has loaded: {e}")
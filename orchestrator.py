@@ -0,0 +1,303 @@
+# Orchestrator: asyncio engine that runs any number of agents from a config file, without one thread per agent
+# Every turn goes through three awaitable stages:
+#   LLM: the speaker's reply from Ollama (AsyncOllamaClient, so waiting on Ollama doesn't need a thread)
+#   TTS: Coqui is blocking, so synthesis runs on a small shared thread pool, no matter how many agents there are
+#   Playback: one playback task plays the finished turns in order, so only one agent talks at a time
+# Like the threaded version in multi_agent_gpt.py, the next speaker's LLM and TTS stages run while the current speaker is still talking,
+# replies are cut off after the agent's max_sentences, and each sentence is synthesized separately, so playback starts after the first one.
+# To run it with text input from the console:
+#   python orchestrator.py --config agents.json
+import re
+import random
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from rich import print
+from agent_context import AgentContext, summary_prompt
+from agent_config import load_agent_configs
+from speech_pipeline import split_sentences, limit_sentences
+
+class AsyncAgent:
+
+    def __init__(self, name, agent_id, system_prompt, tts_voice=None, tts_model=None, filter_name="",
+                 token_budget=6000, keep_recent=12, count_tokens=None, options=None, max_sentences=None, summarize=None):
+        self.name = name
+        self.options = options or {}  # Ollama generation options for this agent's replies (num_predict, stop, ...)
+        self.max_sentences = max_sentences  # Replies are cut off after this many sentences (None = no limit)
+        self.agent_id = agent_id
+        self.tts_voice = tts_voice
+        self.tts_model = tts_model
+        self.filter_name = filter_name
+        self.tts = None  # TTSHandle, acquired the first time this agent speaks
+        self.system_prompt = f" Your real name is {self.name} " + system_prompt.get("content", "")
+        # summarize(name, previous_summary, messages) folds older messages into the running summary, on AgentContext's thread.
+        # Without it, messages that leave the window are just dropped.
+        self.context = AgentContext(self.system_prompt, token_budget=token_budget, keep_recent=keep_recent,
+                                    summarize=self._summarizer(summarize), count_tokens=count_tokens, name=name)
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        return cls(config["name"], config["agent_id"], config["system_prompt"], tts_voice=config["tts_voice"],
+                   tts_model=config["tts_model"], filter_name=config["filter_name"],
+                   options=config.get("options"), max_sentences=config.get("max_sentences"), **kwargs)
+
+    def _summarizer(self, summarize):
+        if summarize is None:
+            return None
+        return lambda previous_summary, messages: summarize(self.name, previous_summary, messages)
+
+
+class Orchestrator:
+    """
+    Parameters:
+    agents (list): AsyncAgent objects
+    generate (coroutine function): generate(agent, messages) -> reply text
+    synthesize (function): synthesize(agent, text) -> audio (anything play() accepts), or None to skip. Runs on the TTS thread pool.
+    play (coroutine function): play(agent, audio), returns once the audio has finished. Returning False (skipped) drops the rest of the reply.
+    tts_workers (int): size of the TTS thread pool, shared by all agents
+    lookahead (int): how many turns can be prepared while one is playing. 1 matches the threaded version.
+    on_message (function): optional on_message(agent, text), called after an agent's audio has played (e.g. to update the frontend)
+    """
+
+    def __init__(self, agents, generate, synthesize, play, tts_workers=2, lookahead=1, on_message=None):
+        self.agents = agents
+        self.generate = generate
+        self.synthesize = synthesize
+        self.play = play
+        self.on_message = on_message
+        self.tts_executor = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts")
+        self.lookahead = lookahead
+        self.paused = False
+        self.turns_played = 0
+        self.max_turns = None
+        # Bumped by every human activation. Each queued turn carries the chain it belongs to, and a handoff from an older chain
+        # is dropped, so there's only ever one chain of agent-to-agent handoffs (like TurnScheduler, which dedupes its requests).
+        self.chain = 0
+        # Created in run(), so they belong to the running event loop
+        self.turn_requests = None
+        self.playback_queue = None
+        self.turn_slots = None
+        self.finished = None
+
+    def request_turn(self, agent, force=False, chain=None):
+        # Agent-to-agent handoffs are ignored while paused, and when a human activation has started a newer chain (chain is the
+        # chain of the turn that's handing off)
+        if self.paused and not force:
+            return False
+        if chain is not None and chain != self.chain:
+            return False
+        self.turn_requests.put_nowait((agent, self.chain))
+        return True
+
+    def activate(self, agent):
+        # Used by the human to pick who talks next. This also unpauses the conversation,
+        # and replaces any handoffs that are still waiting, so the agent the human picked goes next.
+        self.paused = False
+        self.chain += 1
+        while not self.turn_requests.empty():
+            self.turn_requests.get_nowait()
+        return self.request_turn(agent, force=True)
+
+    def pause(self):
+        self.paused = True
+        print("[italic red] Agents have been paused")
+
+    def add_message(self, speaker_name, text, speaker=None):
+        # The speaker sees their own message as "assistant", everyone else sees it as "[NAME] message"
+        for agent in self.agents:
+            if agent is speaker:
+                agent.context.append({"role": "assistant", "content": text})
+            else:
+                agent.context.append({"role": "user", "content": f"[{speaker_name}] {text}"})
+
+    def add_human_message(self, human_name, text):
+        self.add_message(human_name, text)
+        self.activate(random.choice(self.agents))
+
+    async def run(self, first_speaker=None, max_turns=None):
+        # Runs the conversation until max_turns have been played (or forever if max_turns is None)
+        self.turn_requests = asyncio.Queue()
+        self.playback_queue = asyncio.Queue()
+        self.turn_slots = asyncio.Semaphore(self.lookahead + 1)
+        self.finished = asyncio.Event()
+        self.max_turns = max_turns
+        if first_speaker is not None:
+            self.activate(first_speaker)
+        tasks = [asyncio.create_task(self._turn_loop()), asyncio.create_task(self._playback_loop())]
+        try:
+            await self.finished.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        self.finished.set()
+
+    async def _turn_loop(self):
+        while True:
+            speaker, chain = await self.turn_requests.get()
+            # Wait until there's room to prepare another turn, so we never get more than lookahead turns ahead of the audio
+            await self.turn_slots.acquire()
+            if chain != self.chain:
+                # The human activated someone while this handoff was waiting for a slot
+                self.turn_slots.release()
+                continue
+            try:
+                response = await self.generate(speaker, speaker.context.messages())
+            except Exception as e:
+                print(f"[red]{speaker.name} could not get a response: {e}")
+                self.turn_slots.release()
+                continue
+            spoken = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
+            # The history gets what was actually said, not the part that was cut off
+            spoken = limit_sentences(spoken, speaker.max_sentences)
+            sentences = split_sentences(spoken)
+            self.add_message(speaker.name, spoken, speaker=speaker)
+            audio_tasks = [asyncio.create_task(self._synthesize(speaker, sentence)) for sentence in sentences]
+            self.playback_queue.put_nowait((speaker, spoken, audio_tasks))
+            others = [agent for agent in self.agents if agent is not speaker]
+            if others:
+                self.request_turn(random.choice(others), chain=chain)
+
+    async def _synthesize(self, speaker, text):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.tts_executor, self.synthesize, speaker, text)
+        except Exception as e:
+            print(f"[red]TTS failed for {speaker.name}: {e}")
+            return None
+
+    async def _playback_loop(self):
+        while True:
+            speaker, text, audio_tasks = await self.playback_queue.get()
+            try:
+                for i, audio_task in enumerate(audio_tasks):
+                    audio = await audio_task
+                    if audio is not None and await self.play(speaker, audio) is False:
+                        # Skipped: the rest of the reply isn't played (or synthesized, if it hasn't started yet)
+                        for task in audio_tasks[i + 1:]:
+                            task.cancel()
+                        break
+                if self.on_message:
+                    self.on_message(speaker, text)
+            except Exception as e:
+                print(f"[red]Audio playback failed for {speaker.name}: {e}")
+            finally:
+                self.turn_slots.release()
+            self.turns_played += 1
+            if self.max_turns is not None and self.turns_played >= self.max_turns:
+                self.finished.set()
+
+
+# Builds the real LLM/TTS/playback stages: Ollama, Coqui TTS and the gapless audio output (see audio_output.py)
+# Each TTS model is only loaded once (through the shared tts_registry), no matter how many agents use it
+# tts_workers > 0 runs Coqui in that many worker processes instead of on the TTS thread pool (see tts_service.py)
+# Every Ollama request (and the preload) sends the same num_ctx, like OLLAMA_OPTIONS in multi_agent_gpt.py, so the model is loaded once
+# at that size and long prompts aren't cut off at Ollama's smaller default.
+# Returns (generate, synthesize, play, summarize, preload, close). preload() loads the model into Ollama and keeps it loaded
+# (see ModelResidency). Await close() when the conversation is over, it closes the Ollama sessions.
+def build_default_stages(ollama_host="http://localhost:11434", ollama_model="gemma3n:e4b", pool_size=10, tts_workers=0, audio_output="device",
+                         num_ctx=None):
+    from ollama_client import OllamaClient, AsyncOllamaClient, ModelResidency, DEFAULT_NUM_CTX
+    from tts_registry import tts_registry
+    from audio_player import AudioManager
+    if tts_workers:
+        from tts_service import TTSService
+        tts_registry.use_service(TTSService(num_workers=tts_workers))
+
+    state = {}
+    base_options = {"num_ctx": num_ctx or DEFAULT_NUM_CTX}
+    # Summaries are written on AgentContext's background threads, outside the event loop, so they use the blocking client
+    summary_client = OllamaClient(ollama_host, model=ollama_model, pool_size=pool_size, keep_alive="30m")
+    residency = ModelResidency(summary_client, [ollama_model], options=base_options)
+    audio_manager = AudioManager(output=audio_output)
+    playback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playback")
+
+    async def generate(agent, messages):
+        if "client" not in state:
+            state["client"] = AsyncOllamaClient(ollama_host, model=ollama_model, pool_size=pool_size, keep_alive="30m")
+        return await state["client"].chat(messages, options={**base_options, **agent.options})
+
+    def synthesize(agent, text):
+        text = ''.join(c for c in text if c.isascii() and c not in '*')
+        if len(text.strip()) < 5:
+            return None
+        if agent.tts is None:
+            agent.tts = tts_registry.acquire(agent.tts_model, speaker=agent.tts_voice)
+        # Stays in memory as an AudioBuffer, no wav files
+        return agent.tts.synthesize(text)
+
+    async def play(agent, audio_buffer):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(playback_executor, audio_manager.play_buffer, audio_buffer)
+
+    def summarize(agent_name, previous_summary, messages):
+        # Same prompt as the threaded agents in multi_agent_gpt.py
+        return summary_client.generate(summary_prompt(agent_name, previous_summary, messages),
+                                      options={**base_options, "num_predict": 400})
+
+    def preload():
+        residency.preload()
+        residency.start()
+
+    async def close():
+        residency.stop()
+        if "client" in state:
+            await state.pop("client").close()
+        summary_client.close()
+
+    return generate, synthesize, play, summarize, preload, close
+
+
+async def console_input(orchestrator, human_name):
+    # Reads text from the console without blocking the event loop. Type 'exit' to quit.
+    loop = asyncio.get_running_loop()
+    while True:
+        user_input = await loop.run_in_executor(None, input, "You: ")
+        if user_input.strip().lower() == 'exit':
+            orchestrator.stop()
+            return
+        if user_input.strip():
+            orchestrator.add_human_message(human_name, user_input)
+
+async def main(config_path, human_name, ollama_model, tts_workers=0, audio_output="device", num_ctx=None):
+    from ollama_client import DEFAULT_NUM_CTX
+    num_ctx = num_ctx or DEFAULT_NUM_CTX
+    agent_configs = load_agent_configs(config_path)
+    generate, synthesize, play, summarize, preload, close = build_default_stages(
+        ollama_model=ollama_model, pool_size=len(agent_configs), tts_workers=tts_workers, audio_output=audio_output, num_ctx=num_ctx)
+    agents = [AsyncAgent.from_config(config, summarize=summarize) for config in agent_configs]
+    token_budget = max(agent.context.token_budget for agent in agents)
+    if num_ctx < token_budget:
+        raise ValueError(f"num_ctx ({num_ctx}) is smaller than the agents' token budget ({token_budget}), Ollama would cut off their prompts")
+    # Loads the LLM into Ollama now, instead of on the first agent's turn
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, preload)
+    except Exception as e:
+        print(f"[yellow]Couldn't preload the Ollama model, the first turn will load it: {e}")
+    def on_message(agent, text):
+        print(f"[magenta][{agent.name}] {text}")
+    orchestrator = Orchestrator(agents, generate, synthesize, play, on_message=on_message)
+    print(f"[italic green]!!{len(agents)} AGENTS ARE READY TO GO!!\nType your message and press Enter. Type 'exit' to quit.")
+    input_task = asyncio.create_task(console_input(orchestrator, human_name))
+    try:
+        await orchestrator.run()
+    finally:
+        input_task.cancel()
+        await close()
+    from tts_registry import tts_registry
+    tts_registry.close()
+    if tts_registry.cache is not None:
+        print(f"[blue]{tts_registry.cache.report()}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the multi-agent conversation on asyncio")
+    parser.add_argument("--config", default="agents.json")
+    parser.add_argument("--human-name", default="HUMAN")
+    parser.add_argument("--model", default="gemma3n:e4b")
+    parser.add_argument("--tts-workers", type=int, default=0, help="run Coqui in this many worker processes (0 = in this process)")
+    parser.add_argument("--audio-output", default="device", help="'device', 'null' or 'file:<path>.wav' (the last two work without a sound card)")
+    parser.add_argument("--num-ctx", type=int, default=None, help="Ollama context size for every request (default: same as multi_agent_gpt.py)")
+    args = parser.parse_args()
+    asyncio.run(main(args.config, args.human_name, args.model, args.tts_workers, args.audio_output, args.num_ctx))
@@ -0,0 +1,100 @@
+# SpeculativeDrafter: Lets several candidate next speakers write their reply at the same time
+# While the current agent is still talking, every candidate drafts a reply against a snapshot of its own history.
+# The first draft to finish wins and that agent speaks next; the other drafts are cancelled and thrown away.
+# A thread pool caps how many drafts run at once, so we don't flood a local Ollama with more requests than it can batch.
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+from rich import print
+
+class DraftRound:
+    """
+    One round of drafting, started right after an agent finishes its reply.
+    Each candidate is drafted with draft_fn(agent, messages, cancel_event), which returns the reply text (or None if cancelled).
+    """
+
+    def __init__(self, executor, candidates, draft_fn):
+        self.cancel_event = threading.Event()
+        self.futures = {}
+        for agent in candidates:
+            # Snapshot now, so later messages can't sneak into a draft halfway through
+            # (version first, so a message added in between makes the draft look stale rather than fresh)
+            version = len(agent.history)
+            messages = agent.context.messages()
+            future = executor.submit(draft_fn, agent, messages, self.cancel_event)
+            self.futures[future] = (agent, version)
+
+    def first_finished(self):
+        # Blocks until a draft finishes successfully. Returns (agent, text, history_version), or None if every draft failed.
+        pending = set(self.futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                agent, version = self.futures[future]
+                try:
+                    text = future.result()
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    print(f"[red]Draft for {agent.name} failed: {e}")
+                    continue
+                if text:
+                    return agent, text, version
+        return None
+
+    def cancel(self):
+        # Stops any drafts still generating. Drafts that haven't started yet are skipped entirely.
+        self.cancel_event.set()
+        for future in self.futures:
+            future.cancel()
+
+
+class SpeculativeDrafter:
+    """
+    Parameters:
+    draft_fn (callable): draft_fn(agent, messages, cancel_event) -> reply text, should stop early once cancel_event is set
+    max_concurrency (int): max drafts generating at the same time (keep this <= OLLAMA_NUM_PARALLEL)
+    top_k (int): how many candidates to draft for. None means every other agent.
+    """
+
+    def __init__(self, draft_fn, max_concurrency=2, top_k=None):
+        self.draft_fn = draft_fn
+        self.top_k = top_k
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="draft")
+        self.current_round = None
+        self.lock = threading.Lock()
+
+    def start_round(self, candidates, on_winner):
+        """
+        Starts drafting for the candidates (or a random top_k of them), and returns immediately.
+        on_winner(agent, text, history_version) is called from a background thread with the first finished draft.
+        """
+        if self.top_k is not None and len(candidates) > self.top_k:
+            candidates = random.sample(candidates, self.top_k)
+        with self.lock:
+            # Only one round at a time. A new round means the old drafts are out of date.
+            if self.current_round:
+                self.current_round.cancel()
+            draft_round = DraftRound(self.executor, candidates, self.draft_fn)
+            self.current_round = draft_round
+        print(f"[cyan]Drafting replies for: {', '.join(agent.name for agent in candidates)}")
+        threading.Thread(target=self._pick_winner, args=(draft_round, on_winner), daemon=True).start()
+        return draft_round
+
+    def cancel(self):
+        with self.lock:
+            if self.current_round:
+                self.current_round.cancel()
+                self.current_round = None
+
+    def _pick_winner(self, draft_round, on_winner):
+        result = draft_round.first_finished()
+        draft_round.cancel()
+        with self.lock:
+            if self.current_round is not draft_round:
+                return  # This round was replaced or cancelled while drafting
+            self.current_round = None
+        if result is None:
+            print("[red]Every draft failed, the conversation has stopped.")
+            return
+        on_winner(*result)
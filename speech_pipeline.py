@@ -0,0 +1,229 @@
+# SpeechPipeline: Turns a stream of LLM text into audio that starts playing after the first sentence
+# The LLM thread feeds text into a SentenceSplitter, and every finished sentence is submitted to the pipeline.
+# A synthesis thread turns sentences into audio files one at a time, and a playback thread plays them in order.
+# The playback thread grabs the speaking lock as soon as the first clip is ready, so time-to-first-audio only depends on the first sentence.
+# Finished clips wait in a bounded queue, so synthesis runs at most a few sentences ahead of playback.
+# Every turn logs how much of the synthesis was hidden behind playback.
+# Skipping a clip (F9) skips the rest of the reply: the clips that are waiting are thrown away and the remaining sentences aren't synthesized.
+import re
+import time
+import queue
+import threading
+from rich import print
+
+# Sentence boundaries: ., ! or ? (optionally followed by closing quotes/brackets), then whitespace
+SENTENCE_END_PATTERN = re.compile(r'[.!?]+["\')\]]*\s+')
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+class SentenceSplitter:
+    """
+    Incrementally splits streamed text into sentences.
+    Text inside <think>...</think> blocks (reasoning models) is dropped, even if the tags arrive split across chunks.
+    """
+
+    def __init__(self, min_length=12):
+        # Sentences shorter than this get merged into the next one, so "Wow!" doesn't become its own TTS call
+        self.min_length = min_length
+        self.buffer = ""   # visible text that hasn't been returned as a sentence yet
+        self.pending = ""  # raw text held back because it might be part of a think tag
+        self.in_think = False
+
+    def feed(self, text):
+        # Adds a chunk of streamed text and returns a list of any sentences that are now complete
+        self._consume(self.pending + text)
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_PATTERN.finditer(self.buffer):
+            if match.end() - start < self.min_length:
+                continue
+            sentences.append(self.buffer[start:match.end()].strip())
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        # Returns whatever is left once the stream has ended
+        if not self.in_think:
+            self.buffer += self.pending
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        self.pending = ""
+        self.in_think = False
+        return [remainder] if remainder else []
+
+    def _consume(self, raw):
+        # Move raw text into the visible buffer, skipping anything inside think tags
+        self.pending = ""
+        while raw:
+            if self.in_think:
+                end = raw.find(THINK_CLOSE)
+                if end == -1:
+                    self.pending = raw[-(len(THINK_CLOSE) - 1):]
+                    return
+                raw = raw[end + len(THINK_CLOSE):]
+                self.in_think = False
+                continue
+            start = raw.find(THINK_OPEN)
+            if start != -1:
+                self.buffer += raw[:start]
+                raw = raw[start + len(THINK_OPEN):]
+                self.in_think = True
+                continue
+            # Hold back a trailing "<thi" in case the rest of the tag is in the next chunk
+            for k in range(len(THINK_OPEN) - 1, 0, -1):
+                if raw.endswith(THINK_OPEN[:k]):
+                    self.buffer += raw[:-k]
+                    self.pending = raw[-k:]
+                    return
+            self.buffer += raw
+            return
+
+
+def split_sentences(text, max_sentences=None):
+    # Splits a finished reply into sentences, keeping only the first max_sentences (None = all of them)
+    splitter = SentenceSplitter()
+    sentences = splitter.feed(text) + splitter.flush()
+    return sentences[:max_sentences] if max_sentences else sentences
+
+
+def limit_sentences(text, max_sentences):
+    # Cuts a finished reply down to its first max_sentences sentences (None = no limit)
+    if not max_sentences:
+        return text
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return text
+    return ' '.join(sentences[:max_sentences])
+
+
+class SpeechPipeline:
+    """
+    Parameters:
+    synthesize (callable): takes a sentence and returns its audio, an AudioBuffer or a file path (or None to skip it)
+    play (callable): takes that audio and plays it, blocking until it's done. Returns False if the listener skipped it.
+    speaking_lock (threading.Lock): held for the entire time this pipeline is playing audio
+    on_finished (callable): optional, called while still holding the speaking lock once all audio has played
+    stop_event (threading.Event): optional, stops synthesis and playback early when set (e.g. on shutdown)
+    max_queued_clips (int): how many synthesized clips can wait for playback before synthesis pauses
+    report (bool): print the synthesis/playback overlap once the turn is done
+    """
+
+    _DONE = object()
+
+    def __init__(self, synthesize, play, speaking_lock, on_finished=None, stop_event=None, name="agent", max_queued_clips=3, report=True):
+        self.synthesize = synthesize
+        self.play = play
+        self.speaking_lock = speaking_lock
+        self.on_finished = on_finished
+        self.stop_event = stop_event or threading.Event()
+        self.name = name
+        self.report = report
+        self.text_queue = queue.Queue()
+        self.audio_queue = queue.Queue(maxsize=max_queued_clips)
+        self.clips_played = 0
+        self.skipped = False  # Set once a clip is skipped. Everything after it in this turn is dropped.
+        self.error = None
+        # (start, end) times for every clip, for stats()
+        self.created_at = time.perf_counter()
+        self.synthesis_times = []
+        self.playback_times = []
+        self.synthesis_thread = threading.Thread(target=self._synthesis_loop, daemon=True)
+        self.playback_thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self.synthesis_thread.start()
+        self.playback_thread.start()
+
+    def submit(self, sentence):
+        # Queue a sentence for synthesis. Returns immediately.
+        if sentence and sentence.strip():
+            self.text_queue.put(sentence)
+
+    def close(self):
+        # No more sentences are coming
+        self.text_queue.put(self._DONE)
+
+    def join(self, timeout=None):
+        # Wait until every queued sentence has been synthesized and played
+        self.synthesis_thread.join(timeout)
+        self.playback_thread.join(timeout)
+
+    def stats(self):
+        # Timing for this turn, in seconds. overlap is how much synthesis happened while audio was already playing.
+        synthesis = sum(end - start for start, end in self.synthesis_times)
+        playback = sum(end - start for start, end in self.playback_times)
+        overlap = sum(max(0.0, min(s_end, p_end) - max(s_start, p_start))
+                      for s_start, s_end in self.synthesis_times for p_start, p_end in self.playback_times)
+        first_audio = self.playback_times[0][0] - self.created_at if self.playback_times else None
+        return {"clips": len(self.playback_times), "first_audio": first_audio, "synthesis": synthesis,
+                "playback": playback, "overlap": overlap}
+
+    def _print_stats(self):
+        stats = self.stats()
+        if not stats["clips"]:
+            return
+        hidden = stats["overlap"] / stats["synthesis"] if stats["synthesis"] else 0.0
+        print(f"[grey]({self.name}) {stats['clips']} clips: first audio after {stats['first_audio']:.2f}s, "
+              f"synthesis {stats['synthesis']:.2f}s, playback {stats['playback']:.2f}s, "
+              f"{stats['overlap']:.2f}s of synthesis overlapped playback ({hidden:.0%})")
+
+    def _put_audio(self, item):
+        # The queue is bounded, so this waits for playback to catch up, unless playback has stopped for good
+        while True:
+            try:
+                self.audio_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.stop_event.is_set() or not self.playback_thread.is_alive():
+                    return False
+
+    def _synthesis_loop(self):
+        while True:
+            sentence = self.text_queue.get()
+            if sentence is self._DONE or self.stop_event.is_set():
+                break
+            if self.skipped:
+                continue
+            start = time.perf_counter()
+            try:
+                audio_file = self.synthesize(sentence)
+            except Exception as e:
+                print(f"[red]({self.name}) TTS failed for sentence, skipping it: {e}")
+                self.error = e
+                continue
+            self.synthesis_times.append((start, time.perf_counter()))
+            if self.skipped:
+                continue
+            if audio_file and not self._put_audio(audio_file):
+                return
+        self._put_audio(self._DONE)
+
+    def _playback_loop(self):
+        audio_file = self.audio_queue.get()
+        if audio_file is self._DONE:
+            # Nothing was spoken, so there's no reason to take the speaking lock
+            return
+        with self.speaking_lock:
+            print(f"[grey]({self.name}) Acquired speaking lock.")
+            while audio_file is not self._DONE:
+                if self.stop_event.is_set():
+                    print(f"[yellow]({self.name}) aborting speech due to shutdown.")
+                    return
+                start = time.perf_counter()
+                try:
+                    if self.play(audio_file) is False:
+                        self.skipped = True
+                    self.clips_played += 1
+                except Exception as e:
+                    print(f"[red]({self.name}) Audio playback interrupted or failed: {e}")
+                    self.error = e
+                self.playback_times.append((start, time.perf_counter()))
+                audio_file = self.audio_queue.get()
+                if self.skipped:
+                    # Throw away the rest of this reply. The synthesis thread stops synthesizing and only sends _DONE.
+                    while audio_file is not self._DONE:
+                        audio_file = self.audio_queue.get()
+                    print(f"[yellow]({self.name}) Skipped the rest of the reply.")
+            if self.report:
+                self._print_stats()
+            if self.on_finished and not self.stop_event.is_set():
+                self.on_finished()
@@ -0,0 +1,119 @@
+# StartupProfiler: Runs the slow parts of startup (model loads, waiting for Ollama) on background threads at the same time,
+# and keeps track of how long each one took, so report() can show where every second went.
+# LazyModel: Holds a model that's only loaded when it's first needed (e.g. Whisper, which text mode never uses).
+import time
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from rich import print
+
+class StartupProfiler:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.steps = []  # [name, start offset, end offset or None, "foreground"/"background", error or None]
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name):
+        # Times a step that runs on the calling thread:
+        #   with startup.step("load agents"): ...
+        entry = self._begin(name, "foreground")
+        try:
+            yield
+        except Exception as e:
+            self._end(entry, e)
+            raise
+        self._end(entry)
+
+    def background(self, name, function, *args, **kwargs):
+        # Runs function on its own thread and returns a Future for its result
+        future = Future()
+        entry = self._begin(name, "background")
+
+        def run():
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self._end(entry, e)
+                print(f"[red]Startup step '{name}' failed: {e}")
+                future.set_exception(e)
+                return
+            self._end(entry)
+            future.set_result(result)
+
+        threading.Thread(target=run, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def report(self):
+        # One line per step: when it started and finished (seconds since startup), how long it took, and where it ran
+        total = time.perf_counter() - self.started_at
+        lines = [f"Startup took {total:.2f}s:"]
+        with self.lock:
+            steps = sorted(self.steps, key=lambda step: step[1])
+        for name, start, end, where, error in steps:
+            if end is None:
+                lines.append(f"  {name:<32} {start:6.2f}s ->   ...   still running ({where})")
+                continue
+            status = f" FAILED: {error}" if error else ""
+            lines.append(f"  {name:<32} {start:6.2f}s -> {end:6.2f}s  {end - start:6.2f}s ({where}){status}")
+        busy = sum(end - start for _, start, end, _, _ in steps if end is not None)
+        if total > 0:
+            lines.append(f"  {busy:.2f}s of work in {total:.2f}s of wall time ({busy / total:.1f}x from running steps in parallel)")
+        return "\n".join(lines)
+
+    def _begin(self, name, where):
+        entry = [name, time.perf_counter() - self.started_at, None, where, None]
+        with self.lock:
+            self.steps.append(entry)
+        return entry
+
+    def _end(self, entry, error=None):
+        with self.lock:
+            entry[2] = time.perf_counter() - self.started_at
+            entry[4] = error
+
+
+class LazyModel:
+    """
+    Parameters:
+    name (str): shown in the startup report
+    factory (callable): builds the model. Only called once, by whoever needs it first.
+    profiler (StartupProfiler): optional, records how long loading took
+    """
+
+    def __init__(self, name, factory, profiler=None):
+        self.name = name
+        self.factory = factory
+        self.profiler = profiler
+        self.future = None
+        self.lock = threading.Lock()
+
+    def load_in_background(self):
+        # Starts loading without waiting for it. Does nothing if it's already loading or loaded.
+        with self.lock:
+            # A load that failed is tried again the next time it's needed
+            if self.future is None or (self.future.done() and self.future.exception() is not None):
+                if self.profiler is not None:
+                    self.future = self.profiler.background(self.name, self.factory)
+                else:
+                    self.future = Future()
+                    threading.Thread(target=self._load_into, args=(self.future,), daemon=True).start()
+            return self.future
+
+    def get(self, timeout=None):
+        # Returns the model, loading it first (or waiting for the background load) if needed
+        future = self.load_in_background()
+        if not future.done():
+            print(f"[blue]Waiting for {self.name} to finish loading...")
+        return future.result(timeout)
+
+    @property
+    def loaded(self):
+        return self.future is not None and self.future.done() and self.future.exception() is None
+
+    def _load_into(self, future):
+        try:
+            future.set_result(self.factory())
+        except Exception as e:
+            future.set_exception(e)
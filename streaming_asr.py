@@ -0,0 +1,129 @@
+# StreamingTranscriber: Transcribes the mic while the human is still talking, so the transcript is ready right after they stop
+# The recorder thread feeds it audio chunks. Every step_s a background thread transcribes the audio it has so far with Whisper
+# (word timestamps), and words are "committed" once two passes in a row agree on them (local agreement).
+# Committed words never change again, and once the uncommitted audio gets longer than window_s it's cut off at the end of the last
+# committed word, so every pass (including the last one, after the key is released) only covers the last few seconds of speech.
+import re
+import time
+import threading
+import numpy as np
+from rich import print
+from audio_normalize import resample
+
+WHISPER_SAMPLE_RATE = 16000
+
+def _normalize_word(word):
+    # " Hello," and "hello" are the same word
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class StreamingTranscriber:
+    """
+    Parameters:
+    whisper (WhisperManager): a loaded model, see whisper_openai.py
+    step_s (float): how often the audio so far is transcribed again while recording
+    window_s (float): most uncommitted audio kept. Longer audio is cut at the end of the last committed word.
+    min_audio_s (float): don't bother transcribing less than this
+    """
+
+    def __init__(self, whisper, step_s=1.0, window_s=10.0, min_audio_s=1.0):
+        self.whisper = whisper
+        self.step_s = step_s
+        self.window_s = window_s
+        self.min_audio_s = min_audio_s
+        self.sample_rate = None  # Capture rate, set by the first feed()
+        self.chunks = []  # Fed by the recorder thread, collected by the transcription thread
+        self.chunks_lock = threading.Lock()
+        self.audio = np.zeros(0, dtype=np.float32)  # Mono audio at the capture rate that hasn't been cut off yet
+        self.offset = 0.0  # Time (in seconds since recording started) of the first sample in self.audio
+        self.committed = []  # (word, start, end) that two passes agreed on
+        self.hypothesis = []  # Words after the committed ones from the last pass, waiting for the next pass to agree
+        self.pass_times = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._transcribe_loop, name="streaming-asr", daemon=True)
+        self.thread.start()
+
+    def feed(self, pcm, sample_rate):
+        # Called by the recorder thread with int16 frames, shape (frames,) or (frames, channels). Never blocks on Whisper.
+        samples = pcm.astype(np.float32) / 32768.0
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1)
+        with self.chunks_lock:
+            self.sample_rate = sample_rate
+            self.chunks.append(samples)
+
+    def finish(self):
+        # Called once recording has stopped. Transcribes whatever hasn't been committed yet and returns the whole transcript.
+        self.stop_event.set()
+        self.thread.join()
+        self._collect_chunks()
+        tail = self.hypothesis
+        if self.sample_rate is not None and len(self.audio) > 0.1 * self.sample_rate:
+            tail = self._after_committed(self._transcribe())
+        if self.pass_times:
+            print(f"[grey]Streaming transcription: {len(self.pass_times)} passes, "
+                  f"{sum(self.pass_times) / len(self.pass_times):.2f}s each on average, last one took {self.pass_times[-1]:.2f}s.")
+        return ''.join(word for word, _, _ in self.committed + tail).strip()
+
+    @property
+    def text(self):
+        # The committed part of the transcript so far
+        return ''.join(word for word, _, _ in self.committed).strip()
+
+    def _transcribe_loop(self):
+        while not self.stop_event.wait(self.step_s):
+            self._collect_chunks()
+            if self.sample_rate is None or len(self.audio) < self.min_audio_s * self.sample_rate:
+                continue
+            try:
+                words = self._transcribe()
+            except Exception as e:
+                print(f"[red]Streaming transcription pass failed: {e}")
+                continue
+            self._agree(words)
+            self._trim()
+
+    def _collect_chunks(self):
+        with self.chunks_lock:
+            chunks, self.chunks = self.chunks, []
+        if chunks:
+            self.audio = np.concatenate([self.audio] + chunks)
+
+    def _transcribe(self):
+        # Returns [(word, start, end)] for self.audio, with times in seconds since recording started
+        start = time.perf_counter()
+        words = self.whisper.transcribe_words(resample(self.audio, self.sample_rate, WHISPER_SAMPLE_RATE), WHISPER_SAMPLE_RATE)
+        self.pass_times.append(time.perf_counter() - start)
+        return [(word, self.offset + word_start, self.offset + word_end) for word, word_start, word_end in words]
+
+    def _agree(self, words):
+        # Commits the longest prefix this pass and the last pass agree on
+        new = self._after_committed(words)
+        agreed = 0
+        while (agreed < min(len(new), len(self.hypothesis))
+               and _normalize_word(new[agreed][0]) == _normalize_word(self.hypothesis[agreed][0])):
+            agreed += 1
+        self.committed.extend(new[:agreed])
+        self.hypothesis = new[agreed:]
+
+    def _after_committed(self, words):
+        # Drops the words of a pass that were already committed: the ones that end before the last committed word,
+        # and Whisper repeating the last few committed words at the start
+        if not self.committed:
+            return words
+        last_end = self.committed[-1][2]
+        words = [word for word in words if word[2] > last_end + 0.05]
+        for n in range(min(5, len(words), len(self.committed)), 0, -1):
+            if ([_normalize_word(word) for word, _, _ in self.committed[-n:]]
+                    == [_normalize_word(word) for word, _, _ in words[:n]]):
+                return words[n:]
+        return words
+
+    def _trim(self):
+        # Cuts off audio that's already been committed, once there's more than window_s of it
+        if not self.committed or len(self.audio) < self.window_s * self.sample_rate:
+            return
+        cut = int((self.committed[-1][2] - self.offset) * self.sample_rate)
+        if cut > 0:
+            self.audio = self.audio[cut:]
+            self.offset += cut / self.sample_rate
@@ -0,0 +1,45 @@
+import time
+import wave
+import threading
+import numpy as np
+from audio_output import AudioOutput
+
+
+def test_skip_from_another_thread_during_a_clip_longer_than_the_ring(tmp_path):
+    path = tmp_path / "out.wav"
+    output = AudioOutput(sink=f"file:{path}", sample_rate=8000, channels=1, buffer_ms=200, block_frames=256)
+    clip = np.full((8000 * 5, 1), 1000, dtype=np.int16)  # 5 s, 25 times the ring buffer
+    result = {}
+    player = threading.Thread(target=lambda: result.setdefault("played", output.play_pcm(clip)))
+    player.start()
+    time.sleep(0.3)
+
+    start = time.monotonic()
+    output.skip()
+    skip_seconds = time.monotonic() - start
+    player.join(timeout=1)
+    output.close()
+
+    assert skip_seconds < 0.1
+    assert not player.is_alive()
+    assert result["played"] is False
+    with wave.open(str(path), "rb") as wav_file:
+        played = wav_file.getnframes() / wav_file.getframerate()
+    # What had played before the skip, plus at most what was already in the ring buffer
+    assert played < 0.3 + 0.2 + 0.2
+
+
+def test_clip_queued_after_skip_still_plays():
+    output = AudioOutput(sink="null", sample_rate=8000, channels=1, buffer_ms=2000)
+    output.started = True  # No sink thread, the test reads the ring buffer itself
+    assert output.play_pcm(np.ones((4000, 1), dtype=np.int16), wait=False)
+    output.skip()
+    assert output.play_pcm(np.full((6000, 1), 2, dtype=np.int16), wait=False)
+
+    block = np.zeros((1024, 1), dtype=np.int16)
+    frames = []
+    while (count := output.read_into(block)):
+        frames.append(block[:count, 0].copy())
+    frames = np.concatenate(frames)
+    assert (frames == 1).sum() == 0
+    assert (frames == 2).sum() == 6000
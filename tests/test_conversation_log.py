@@ -0,0 +1,59 @@
+import json
+from conversation_log import ConversationLog
+
+
+def fill(path, count):
+    log = ConversationLog(str(path), fsync_interval=0)
+    for i in range(count):
+        log.append("OSWALD" if i % 2 else "HUMAN", f"message {i}")
+    return log
+
+
+def contents(records):
+    return [record["content"] for record in records]
+
+
+def test_compact_keeps_the_newest_and_archives_the_rest(tmp_path):
+    log = fill(tmp_path / "conversation.jsonl", 5)
+    archive = tmp_path / "archive.jsonl"
+    assert log.compact(keep_last=2, archive_path=str(archive)) == 3
+    assert contents(log.read()) == ["message 3", "message 4"]
+    assert contents(json.loads(line) for line in archive.read_text().splitlines()) == ["message 0", "message 1", "message 2"]
+    # The index was rebuilt, and appends carry on after the kept messages
+    log.append("HUMAN", "message 5")
+    assert contents(log.read_backwards()) == ["message 5", "message 4", "message 3"]
+    assert log.append("HUMAN", "message 6")["seq"] == 6
+    log.close()
+
+
+def test_compact_keep_last_zero_archives_everything(tmp_path):
+    log = fill(tmp_path / "conversation.jsonl", 4)
+    assert log.compact(keep_last=0, archive_path=str(tmp_path / "archive.jsonl")) == 4
+    assert log.read() == []
+    assert len(log) == 0
+    log.close()
+
+
+def test_torn_last_line_is_removed_on_open(tmp_path):
+    path = tmp_path / "conversation.jsonl"
+    fill(path, 3).close()
+    with open(path, "ab") as log_file:
+        log_file.write(b'{"seq": 3, "time": 1.0, "speaker": "HUM')  # Cut off mid-write by a crash
+    log = ConversationLog(str(path))
+    assert contents(log.read()) == ["message 0", "message 1", "message 2"]
+    assert len(log) == 3
+    assert log.append("HUMAN", "message 3")["seq"] == 3
+    assert contents(log.read_backwards()) == ["message 3", "message 2", "message 1", "message 0"]
+    log.close()
+
+
+def test_index_behind_the_log_is_rebuilt(tmp_path):
+    path = tmp_path / "conversation.jsonl"
+    fill(path, 3).close()
+    # A crash between writing the log line and its index entry
+    with open(path, "ab") as log_file:
+        log_file.write(json.dumps({"seq": 3, "time": 1.0, "speaker": "HUMAN", "content": "message 3"}).encode() + b"\n")
+    log = ConversationLog(str(path))
+    assert len(log) == 4
+    assert contents(log.read_backwards())[0] == "message 3"
+    log.close()
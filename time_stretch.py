@@ -0,0 +1,69 @@
+# Time-stretching with WSOLA (Waveform Similarity Overlap-Add) on NumPy arrays
+# Changes the speed of speech without changing its pitch, like pydub's speedup, but in linear time.
+# pydub's speedup appends ~150ms chunks one at a time with a crossfade, and every append copies the whole output so far,
+# so it gets slower the longer the clip is. Here the output is built in one pass:
+#   1. For each output frame, pick where to read from the input. The frame is read near its nominal position,
+#      shifted (within a small tolerance) to the spot that best lines up with the previous frame, so there are no phase clicks.
+#      The search for every frame is a single np.correlate call over a contiguous slice.
+#   2. All frames are gathered with one fancy-indexing call, windowed, and overlap-added with two reshaped adds.
+import numpy as np
+
+def time_stretch(samples, speed, sample_rate, frame_ms=30, tolerance_ms=8):
+    """
+    Parameters:
+    samples (np.ndarray): float audio, shape (frames,) or (frames, channels)
+    speed (float): 1.15 plays 15% faster (shorter output), 0.9 plays slower
+    sample_rate (int): sample rate of the audio (only used to turn the frame/tolerance sizes into samples)
+    frame_ms (float): length of each overlap-add frame. 20-40ms works well for speech.
+    tolerance_ms (float): how far a frame can move from its nominal position to line up with the previous one
+    Returns the stretched audio with the same dtype and channel layout, about len(samples) / speed frames long.
+    """
+    samples = np.asarray(samples)
+    if speed == 1.0 or samples.shape[0] == 0:
+        return samples
+    dtype = samples.dtype
+    audio = samples.astype(np.float32)
+    mono = audio if audio.ndim == 1 else audio.mean(axis=1)
+
+    half = max(16, int(sample_rate * frame_ms / 2000))  # hop between output frames
+    frame = half * 2
+    analysis_hop = max(1, int(round(half * speed)))  # hop between input frames
+    tolerance = max(1, int(sample_rate * tolerance_ms / 1000))
+    # Zero padding so every frame and search window stays inside the array
+    pad = tolerance + max(frame, analysis_hop) + frame
+    padded_mono = np.concatenate([np.zeros(pad, np.float32), mono, np.zeros(pad + frame, np.float32)])
+    num_frames = int(np.ceil((mono.shape[0] + half) / analysis_hop)) + 1
+
+    # 1. Choose where each frame starts in the (padded) input
+    positions = np.empty(num_frames, dtype=np.int64)
+    positions[0] = pad - half
+    # Only the first half of a frame overlaps the previous one, so that's the only part that needs to line up
+    for k in range(1, num_frames):
+        nominal = pad - half + k * analysis_hop
+        # What would naturally follow the previous frame, i.e. what the overlap region "expects" to hear next
+        natural = positions[k - 1] + half
+        reference = padded_mono[natural:natural + half]
+        similarity = np.correlate(padded_mono[nominal - tolerance:nominal + tolerance + half], reference, 'valid')
+        positions[k] = nominal - tolerance + int(np.argmax(similarity))
+
+    # 2. Gather, window and overlap-add every frame at once
+    # A periodic Hann window at 50% overlap sums to exactly 1, so the volume stays constant
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+    if audio.ndim == 1:
+        padded = padded_mono
+    else:
+        padded = np.concatenate([np.zeros((pad, audio.shape[1]), np.float32), audio, np.zeros((pad + frame, audio.shape[1]), np.float32)])
+    frames = padded[positions[:, None] + np.arange(frame)]  # (num_frames, frame) or (num_frames, frame, channels)
+    frames *= window if audio.ndim == 1 else window[:, None]
+    output = np.zeros(((num_frames + 1) * half,) + audio.shape[1:], dtype=np.float32)
+    blocks = output.reshape((num_frames + 1, half) + audio.shape[1:])
+    blocks[:num_frames] += frames[:, :half]
+    blocks[1:] += frames[:, half:]
+
+    # The first half-frame is only the fade-in over the padding
+    out_length = int(round(mono.shape[0] / speed))
+    output = output[half:half + out_length]
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return np.clip(np.round(output), info.min, info.max).astype(dtype)
+    return output.astype(dtype)
@@ -0,0 +1,243 @@
+# TTSCache: Content-addressed cache for synthesized speech, so a line that has been said before is never synthesized again
+# Every clip is keyed by a stable digest of everything that changes the audio: model, speaker, text, speed and sample rate.
+# (Python's built-in hash() is salted per process, so it can't be used for names that have to survive a restart.)
+# Two tiers:
+#   memory: the most recently used clips as AudioBuffers, up to memory_bytes
+#   disk:   16-bit wav files in cache_dir named <digest>.wav, least recently used deleted first once they go over disk_bytes
+# Catchphrases, intros and replays come straight from memory (or disk after a restart) instead of going through Coqui.
+# New clips are written to disk by a background thread, outside the cache lock, so a miss doesn't add a disk write before playback
+# and other agents' lookups don't wait on it.
+# Each model's sample rate (part of every key) is saved in cache_dir/sample_rates.json, so a lookup never has to load the model to build its key.
+import os
+import json
+import wave
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from rich import print
+from audio_buffer import AudioBuffer
+
+def tts_cache_key(model_name, speaker, text, speed, sample_rate):
+    # Speed is rounded so 1.15 and 1.1500000001 are the same clip
+    fields = [str(model_name), str(speaker or ""), text.strip(), f"{float(speed):.4f}", str(int(sample_rate))]
+    return hashlib.sha256("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Parameters:
+    cache_dir (str): folder for the disk tier
+    disk_bytes (int): size budget for the wav files in cache_dir. 0 turns the disk tier off.
+    memory_bytes (int): size budget for the clips kept in memory. 0 turns the memory tier off.
+    """
+
+    def __init__(self, cache_dir="tts_cache", disk_bytes=500_000_000, memory_bytes=64_000_000):
+        self.cache_dir = os.path.join(os.path.abspath(os.curdir), cache_dir)
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> AudioBuffer, oldest first
+        self.memory_used = 0
+        self.disk = None  # key -> file size, oldest first. Scanned from cache_dir the first time it's needed.
+        self.disk_used = 0
+        self.writing = {}  # key -> AudioBuffer waiting for the writer thread, still served by get()
+        self.write_queue = queue.Queue()
+        self.writer_thread = None
+        self.sample_rates = None  # model name -> sample rate, loaded from sample_rates.json the first time it's needed
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        # Returns the cached AudioBuffer, or None if this clip has never been synthesized (or was evicted)
+        with self.lock:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            audio = self.writing.get(key)
+            if audio is not None:
+                self.memory_hits += 1
+                return audio
+            if self.disk_bytes and key in self._disk_index():
+                try:
+                    audio = self._read_wav(self.file_path(key))
+                except (OSError, EOFError, wave.Error) as e:
+                    print(f"[yellow]TTS cache: dropping unreadable clip {key[:12]}: {e}")
+                    self._remove_from_disk(key)
+                else:
+                    # Mark it as recently used, so the file's age survives a restart too
+                    self.disk.move_to_end(key)
+                    os.utime(self.file_path(key))
+                    self._remember(key, audio)
+                    self.disk_hits += 1
+                    return audio
+            self.misses += 1
+            return None
+
+    def put(self, key, audio):
+        with self.lock:
+            self._remember(key, audio)
+            if self.disk_bytes and key not in self._disk_index() and key not in self.writing:
+                self.writing[key] = audio
+                self.write_queue.put(key)
+                if self.writer_thread is None:
+                    self.writer_thread = threading.Thread(target=self._write_loop, name="tts-cache-writer", daemon=True)
+                    self.writer_thread.start()
+        return audio
+
+    def flush(self):
+        # Waits until every clip that was put() is on disk
+        self.write_queue.join()
+
+    def sample_rate(self, model_name):
+        # The sample rate this model was seen with before (in this run or an earlier one), or None
+        with self.lock:
+            return self._sample_rates().get(model_name)
+
+    def remember_sample_rate(self, model_name, sample_rate):
+        with self.lock:
+            sample_rates = self._sample_rates()
+            if sample_rates.get(model_name) == sample_rate:
+                return
+            sample_rates[model_name] = sample_rate
+            path = os.path.join(self.cache_dir, "sample_rates.json")
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as rates_file:
+                    json.dump(sample_rates, rates_file, indent=1)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"[yellow]TTS cache: could not save sample rates: {e}")
+
+    def file_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def contains_file(self, key):
+        with self.lock:
+            return bool(self.disk_bytes) and key in self._disk_index()
+
+    @property
+    def lookups(self):
+        return self.memory_hits + self.disk_hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return (self.memory_hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        with self.lock:
+            disk_files = len(self.disk) if self.disk is not None else 0
+            return {"lookups": self.lookups, "memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+                    "misses": self.misses, "hit_rate": self.hit_rate,
+                    "memory_clips": len(self.memory), "memory_bytes": self.memory_used,
+                    "disk_clips": disk_files, "disk_bytes": self.disk_used}
+
+    def report(self):
+        s = self.stats()
+        return (f"TTS cache: {s['hit_rate']:.0%} hit rate over {s['lookups']} lines "
+                f"({s['memory_hits']} from memory, {s['disk_hits']} from disk, {s['misses']} synthesized). "
+                f"Holding {s['memory_clips']} clips / {s['memory_bytes'] / 1e6:.1f} MB in memory, "
+                f"{s['disk_clips']} clips / {s['disk_bytes'] / 1e6:.1f} MB on disk.")
+
+    def _remember(self, key, audio):
+        # Called with the lock held
+        if not self.memory_bytes or audio.samples.nbytes > self.memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_used -= old.samples.nbytes
+        self.memory[key] = audio
+        self.memory_used += audio.samples.nbytes
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= evicted.samples.nbytes
+
+    def _sample_rates(self):
+        # Called with the lock held
+        if self.sample_rates is None:
+            try:
+                with open(os.path.join(self.cache_dir, "sample_rates.json"), "r", encoding="utf-8") as rates_file:
+                    self.sample_rates = {name: int(rate) for name, rate in json.load(rates_file).items()}
+            except (OSError, ValueError, AttributeError):
+                self.sample_rates = {}
+        return self.sample_rates
+
+    def _disk_index(self):
+        # Called with the lock held. Oldest files (by last use) come first.
+        if self.disk is None:
+            self.disk = OrderedDict()
+            self.disk_used = 0
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            for _, key, size in sorted(entries):
+                self.disk[key] = size
+                self.disk_used += size
+            self._evict_disk()
+        return self.disk
+
+    def _write_loop(self):
+        while True:
+            key = self.write_queue.get()
+            try:
+                with self.lock:
+                    audio = self.writing.get(key)
+                if audio is not None:
+                    self._write_to_disk(key, audio)
+            finally:
+                self.write_queue.task_done()
+
+    def _write_to_disk(self, key, audio):
+        # Runs on the writer thread. Only updating the index takes the lock, not writing the file.
+        path = self.file_path(key)
+        # Write to a temporary name first, so a crash never leaves a half-written clip behind under a real key
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pcm = audio.to_int16()
+            with wave.open(temp_path, "wb") as wav_file:
+                wav_file.setnchannels(audio.channels)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(audio.sample_rate)
+                wav_file.writeframes(np.ascontiguousarray(pcm).tobytes())
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"[yellow]TTS cache: could not save clip to disk: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with self.lock:
+                self.writing.pop(key, None)
+            return
+        size = os.path.getsize(path)
+        with self.lock:
+            self.writing.pop(key, None)
+            self.disk[key] = size
+            self.disk_used += size
+            self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_used > self.disk_bytes and self.disk:
+            self._remove_from_disk(next(iter(self.disk)))
+
+    def _remove_from_disk(self, key):
+        self.disk_used -= self.disk.pop(key, 0)
+        try:
+            os.remove(self.file_path(key))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _read_wav(path):
+        with wave.open(path, "rb") as wav_file:
+            channels = wav_file.getnchannels()
+            sample_rate = wav_file.getframerate()
+            pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        if channels > 1:
+            pcm = pcm.reshape(-1, channels)
+        return AudioBuffer.from_int16(pcm, sample_rate)
@@ -0,0 +1,258 @@
+# TTSModelRegistry: Loads each Coqui TTS model once per process and shares it between agents
+# Agents call tts_registry.acquire(model_name, speaker) and get back a lightweight TTSHandle for their voice.
+# Every handle on the same model shares one CoquiTTSManager, and a per-model lock makes sure only one thread synthesizes with it at a time.
+# Models are reference counted. When no agent is using a model anymore it stays loaded (in case it's needed again),
+# but idle models are unloaded, least recently used first, whenever loading another model would go over the memory cap.
+# With use_service(), models are loaded and run in worker processes instead (see tts_service.py) and this process never loads them.
+# Synthesized clips go through a TTSCache first, so a line that was already said (by the same voice, at the same speed) is never synthesized again.
+import gc
+import os
+import time
+import threading
+from concurrent.futures import Future
+from rich import print
+from tts_cache import TTSCache, tts_cache_key
+
+def estimate_model_bytes(tts_manager):
+    # Size of the model's weights. Doesn't include activations, but it's the part that scales with the number of copies.
+    try:
+        model = tts_manager.tts.synthesizer.tts_model
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+    except Exception:
+        return 0
+
+
+class _LoadedModel:
+    def __init__(self, model_name, manager):
+        self.model_name = model_name
+        self.manager = manager
+        self.lock = threading.Lock()  # Coqui models aren't safe to use from two threads at once
+        self.last_used = time.monotonic()
+        self.size_bytes = estimate_model_bytes(manager)
+
+
+class TTSHandle:
+    """
+    One agent's view of a shared model. Cheap to create, holds no model state of its own.
+    """
+
+    def __init__(self, registry, model_name, speaker=None):
+        self.registry = registry
+        self.model_name = model_name
+        self.speaker = speaker
+        self.released = False
+
+    def text_to_audio(self, input_text, speaker=None, **kwargs):
+        # Same arguments as CoquiTTSManager.text_to_audio, but defaults to this handle's speaker
+        return self.registry.text_to_audio(self.model_name, input_text, speaker=speaker or self.speaker, **kwargs)
+
+    def synthesize(self, input_text, speaker=None, **kwargs):
+        # Same as CoquiTTSManager.synthesize: returns an in-memory AudioBuffer
+        return self.registry.synthesize(self.model_name, input_text, speaker=speaker or self.speaker, **kwargs)
+
+    @property
+    def sample_rate(self):
+        return self.registry.sample_rate(self.model_name)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.registry.release(self.model_name)
+
+
+class TTSModelRegistry:
+    """
+    Parameters:
+    max_memory_bytes (int): soft cap on the total size of loaded models. Only models that no agent is using get unloaded to stay under it.
+    gpu (bool): load models on the GPU
+    cache (TTSCache): synthesis cache shared by every model, or None to always synthesize
+    """
+
+    def __init__(self, max_memory_bytes=None, gpu=False, cache=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.gpu = gpu
+        self.cache = cache
+        self.service = None
+        self.models = {}
+        self.loading = {}  # model name -> Future, while it's being loaded. Loads happen outside the registry lock.
+        self.ref_counts = {}  # model name -> how many handles are using it (kept even while the model isn't loaded)
+        self.sample_rates = {}  # Kept after a model is unloaded, so cache lookups don't have to load it again
+        self.lock = threading.Lock()
+
+    def use_service(self, service):
+        # Sends synthesis to a TTSService (worker processes) from now on
+        self.service = service
+
+    def close(self):
+        if self.service is not None:
+            self.service.close()
+        if self.cache is not None:
+            self.cache.flush()
+
+    def acquire(self, model_name, speaker=None, load=True):
+        # Returns a handle for this speaker. With load=True the model is loaded now if this is the first agent to ask for it,
+        # otherwise it's loaded by preload() or the first synthesis.
+        with self.lock:
+            self.ref_counts[model_name] = self.ref_counts.get(model_name, 0) + 1
+        if load and self.service is None:
+            self.preload(model_name)
+        return TTSHandle(self, model_name, speaker)
+
+    def release(self, model_name):
+        with self.lock:
+            self.ref_counts[model_name] = max(0, self.ref_counts.get(model_name, 0) - 1)
+            loaded = self.models.get(model_name)
+            if loaded is not None:
+                loaded.last_used = time.monotonic()
+
+    def preload(self, model_name):
+        # Loads the model (or waits for the thread that's already loading it). Different models can load at the same time.
+        if self.service is not None:
+            self.sample_rate(model_name)
+            return
+        self._get_loaded(model_name)
+
+    def get_manager(self, model_name):
+        return self._get_loaded(model_name).manager
+
+    def sample_rate(self, model_name):
+        # Remembered per model (and by the cache across restarts), so building a cache key doesn't load the model
+        if model_name not in self.sample_rates:
+            sample_rate = self.cache.sample_rate(model_name) if self.cache is not None else None
+            if sample_rate is None:
+                if self.service is not None:
+                    sample_rate = self.service.sample_rate(model_name)
+                else:
+                    sample_rate = self._get_loaded(model_name).manager.sample_rate
+                if self.cache is not None:
+                    self.cache.remember_sample_rate(model_name, sample_rate)
+            self.sample_rates[model_name] = sample_rate
+        return self.sample_rates[model_name]
+
+    def synthesize(self, model_name, input_text, speaker=None, speedup=1.15):
+        # CoquiTTSManager.synthesize, but served from the cache when this exact clip has been made before
+        if self.cache is None:
+            return self._synthesize(model_name, input_text, speaker, speedup)
+        key = tts_cache_key(model_name, speaker, input_text, speedup, self.sample_rate(model_name))
+        audio = self.cache.get(key)
+        if audio is None:
+            audio = self.cache.put(key, self._synthesize(model_name, input_text, speaker, speedup))
+        return audio
+
+    def _synthesize(self, model_name, input_text, speaker, speedup):
+        if self.service is not None:
+            return self.service.synthesize(model_name, input_text, speaker=speaker, speedup=speedup)
+        return self.call(model_name, "synthesize", input_text, speaker=speaker, speedup=speedup)
+
+    def text_to_audio(self, model_name, input_text, speaker=None, save_as_wave=True, speedup=1.15, **kwargs):
+        # Wav files come straight from the cache folder when the clip is already there, so repeated lines don't pile up new files.
+        # Otherwise the clip (synthesized once, through the cache) is written with the same file naming as CoquiTTSManager.text_to_audio.
+        # mp3s are still written by CoquiTTSManager.
+        if save_as_wave and (self.cache is not None or self.service is not None):
+            digest = tts_cache_key(model_name, speaker, input_text, speedup, self.sample_rate(model_name))
+            audio = self.synthesize(model_name, input_text, speaker=speaker, speedup=speedup)
+            if self.cache is not None and not kwargs and self.cache.contains_file(digest):
+                return self.cache.file_path(digest)
+            output_dir = os.path.join(os.path.abspath(os.curdir), kwargs.get("subdirectory", "audio_msg"))
+            os.makedirs(output_dir, exist_ok=True)
+            return audio.write(os.path.join(output_dir, f"___Msg{digest}.wav"))
+        if self.service is not None:
+            raise ValueError("The TTS worker processes only write wav files")
+        return self.call(model_name, "text_to_audio", input_text, speaker=speaker, save_as_wave=save_as_wave, speedup=speedup, **kwargs)
+
+    def call(self, model_name, method_name, *args, **kwargs):
+        # Calls a CoquiTTSManager method on the shared model, holding that model's lock
+        # If it isn't loaded yet (or was unloaded while idle), it's loaded first
+        loaded = self._get_loaded(model_name)
+        loaded.last_used = time.monotonic()
+        with loaded.lock:
+            if loaded.manager is not None:
+                return getattr(loaded.manager, method_name)(*args, **kwargs)
+        # It got unloaded between looking it up and locking it, so look it up again
+        return self.call(model_name, method_name, *args, **kwargs)
+
+    def unload_idle(self, idle_seconds=0):
+        # Unloads every model no agent is using that hasn't been used in idle_seconds
+        with self.lock:
+            now = time.monotonic()
+            for model_name in [name for name, loaded in self.models.items() if not self.ref_counts.get(name) and now - loaded.last_used >= idle_seconds]:
+                self._unload(model_name)
+
+    @property
+    def loaded_bytes(self):
+        return sum(loaded.size_bytes for loaded in self.models.values())
+
+    def _get_loaded(self, model_name):
+        with self.lock:
+            loaded = self.models.get(model_name)
+            if loaded is not None:
+                return loaded
+            future = self.loading.get(model_name)
+            if future is not None:
+                waiting = True
+            else:
+                waiting = False
+                future = self.loading[model_name] = Future()
+        if waiting:
+            # Another thread is loading it already
+            return future.result()
+        try:
+            loaded = self._load(model_name)
+        except Exception as e:
+            with self.lock:
+                self.loading.pop(model_name, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.models[model_name] = loaded
+            self.sample_rates[model_name] = loaded.manager.sample_rate
+            self.loading.pop(model_name, None)
+            self._enforce_memory_cap(keep=model_name)
+        if self.cache is not None:
+            self.cache.remember_sample_rate(model_name, loaded.manager.sample_rate)
+        future.set_result(loaded)
+        return loaded
+
+    def _load(self, model_name):
+        # Runs without the registry lock, so other models can load (and loaded ones can synthesize) in the meantime
+        from coqui_tts_manager import CoquiTTSManager
+        print(f"[blue]Loading TTS model '{model_name}' (shared by every agent that uses it)...")
+        start = time.perf_counter()
+        loaded = _LoadedModel(model_name, CoquiTTSManager(model_name=model_name, gpu=self.gpu))
+        print(f"[green]Loaded TTS model '{model_name}' in {time.perf_counter() - start:.1f}s ({loaded.size_bytes / 1e6:.0f} MB of weights)")
+        return loaded
+
+    def _enforce_memory_cap(self, keep):
+        if self.max_memory_bytes is None:
+            return
+        idle = sorted((loaded for name, loaded in self.models.items() if not self.ref_counts.get(name) and name != keep), key=lambda loaded: loaded.last_used)
+        while self.loaded_bytes > self.max_memory_bytes and idle:
+            self._unload(idle.pop(0).model_name)
+        if self.loaded_bytes > self.max_memory_bytes:
+            print(f"[yellow]TTS models in use take {self.loaded_bytes / 1e6:.0f} MB, over the {self.max_memory_bytes / 1e6:.0f} MB cap.")
+
+    def _unload(self, model_name):
+        loaded = self.models.pop(model_name)
+        # Wait for any synthesis still using it to finish
+        with loaded.lock:
+            loaded.manager = None
+        gc.collect()
+        print(f"[yellow]Unloaded idle TTS model '{model_name}'.")
+
+
+# Memory cap for loaded TTS models, in MB, from the TTS_MAX_MODEL_MB environment variable (default 2000, 0 = no cap).
+# Models an agent is using are never unloaded, so this only decides how many idle models stay loaded in case they're needed again.
+DEFAULT_MAX_MODEL_MB = 2000
+
+def max_model_bytes_from_env():
+    value = os.environ.get("TTS_MAX_MODEL_MB", "").strip()
+    try:
+        megabytes = float(value) if value else DEFAULT_MAX_MODEL_MB
+    except ValueError:
+        print(f"[yellow]Ignoring TTS_MAX_MODEL_MB={value!r}, it isn't a number. Using {DEFAULT_MAX_MODEL_MB} MB.")
+        megabytes = DEFAULT_MAX_MODEL_MB
+    return int(megabytes * 1_000_000) if megabytes > 0 else None
+
+
+# One registry (and one synthesis cache) for the whole process
+tts_registry = TTSModelRegistry(max_memory_bytes=max_model_bytes_from_env(), cache=TTSCache())
@@ -0,0 +1,223 @@
+# TTSService: Runs Coqui TTS in separate worker processes, so synthesis doesn't fight the agents, Flask-SocketIO
+# and the keyboard pollers for the GIL
+# Each worker has its own pipe and works on one request at a time. The main process hands the next waiting request to whichever
+# worker is idle, so several workers synthesize different agents' sentences in parallel, with their models loaded and warm.
+# (Coqui's API runs one utterance per forward pass, so grouping requests in one worker would only make them wait on each other.)
+# Because the main process knows which request each worker has, a worker that dies fails its request instead of leaving it hanging.
+# Audio comes back through shared memory: the worker writes the float32 PCM into a SharedMemory block and only sends its name,
+# and the main process copies it out and frees the block, so big arrays are never pickled.
+import sys
+import types
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from concurrent.futures import Future
+import numpy as np
+from rich import print
+from audio_buffer import AudioBuffer
+
+class TTSServiceError(Exception):
+    pass
+
+
+def _send_audio(connection, request_id, audio):
+    # Called in a worker: puts the samples in a new shared memory block, which the main process frees after copying it
+    samples = np.ascontiguousarray(audio.samples, dtype=np.float32)
+    block = shared_memory.SharedMemory(create=True, size=max(1, samples.nbytes))
+    np.ndarray(samples.shape, dtype=np.float32, buffer=block.buf)[:] = samples
+    connection.send(("audio", request_id, (block.name, samples.shape, audio.sample_rate)))
+    block.close()
+
+
+def _worker_main(connection, gpu):
+    # connection is this worker's own pipe to the main process: requests come in one at a time, and every one gets exactly one reply.
+    # Pipe sends are synchronous, so nothing is lost if the worker crashes.
+    from coqui_tts_manager import CoquiTTSManager
+    managers = {}  # Each worker loads a model the first time it's asked for it
+
+    def get_manager(model_name):
+        if model_name not in managers:
+            managers[model_name] = CoquiTTSManager(model_name=model_name, gpu=gpu)
+        return managers[model_name]
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        kind, request_id, model_name = request[:3]
+        try:
+            if kind == "sample_rate":
+                connection.send(("value", request_id, get_manager(model_name).sample_rate))
+            else:
+                _, _, _, text, speaker, speedup = request
+                _send_audio(connection, request_id, get_manager(model_name).synthesize(text, speaker=speaker, speedup=speedup))
+        except Exception as e:
+            connection.send(("error", request_id, f"{type(e).__name__}: {e}"))
+
+
+class TTSService:
+    """
+    Parameters:
+    num_workers (int): number of worker processes. Each one loads its own copy of every model it's asked to use.
+    gpu (bool): load models on the GPU
+    """
+
+    def __init__(self, num_workers=1, gpu=False):
+        # spawn instead of fork: forking a process that already has threads (and maybe CUDA) running isn't safe
+        self.context = multiprocessing.get_context("spawn")
+        self.gpu = gpu
+        self.request_ids = itertools.count()
+        self.pending = {}  # request id -> Future
+        self.waiting = deque()  # Requests that no worker has been given yet, oldest first
+        self.idle = []  # Pipes of workers with nothing to do
+        self.assigned = {}  # pipe -> id of the request that worker is working on
+        self.lock = threading.Lock()
+        self.closed = False
+        self.workers = {}  # pipe -> worker process
+        for _ in range(num_workers):
+            self._start_worker()
+        self.listener = threading.Thread(target=self._listen, name="tts-service-results", daemon=True)
+        self.listener.start()
+
+    def submit(self, model_name, text, speaker=None, speedup=1.15):
+        # Returns a Future for the AudioBuffer
+        return self._submit("synthesize", model_name, text, speaker, speedup)
+
+    def synthesize(self, model_name, text, speaker=None, speedup=1.15, timeout=None):
+        return self.submit(model_name, text, speaker=speaker, speedup=speedup).result(timeout)
+
+    def sample_rate(self, model_name, timeout=None):
+        # Loads the model in a worker (if it isn't already) and returns its output sample rate
+        return self._submit("sample_rate", model_name).result(timeout)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            workers = dict(self.workers)
+            # Idle workers stop right away, busy ones once they've sent their current result
+            for connection in workers:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+            unsent = [request[1] for request in self.waiting]
+            self.waiting.clear()
+        self._fail(unsent, "TTS service was closed")
+        # The listener reads the last results and returns once every worker has exited
+        self.listener.join(timeout=10)
+        for worker in workers.values():
+            if worker.is_alive():
+                worker.terminate()
+        with self.lock:
+            request_ids = list(self.pending)
+        self._fail(request_ids, "TTS service was closed")
+
+    def _submit(self, kind, *args):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise TTSServiceError("TTS service is closed")
+            request_id = next(self.request_ids)
+            self.pending[request_id] = future
+            self.waiting.append((kind, request_id) + args)
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        # Called with the lock held: gives waiting requests to idle workers
+        while self.waiting and self.idle:
+            connection = self.idle.pop()
+            request = self.waiting.popleft()
+            self.assigned[connection] = request[1]
+            connection.send(request)
+
+    def _start_worker(self):
+        connection, worker_connection = self.context.Pipe()
+        worker = self.context.Process(target=_worker_main, name="tts-worker", daemon=True, args=(worker_connection, self.gpu))
+        # spawn normally re-runs the main script in the child, which for multi_agent_gpt.py would load Whisper, pygame and Flask
+        # in every worker. The workers only need this module, so they start from an empty __main__ instead.
+        main_module = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            worker.start()
+        finally:
+            sys.modules["__main__"] = main_module
+        worker_connection.close()  # Only the worker has this end now, so our end sees EOF when it exits
+        with self.lock:
+            self.workers[connection] = worker
+            self.idle.append(connection)
+            self._dispatch()
+
+    def _listen(self):
+        while True:
+            with self.lock:
+                connections = list(self.workers)
+            if not connections:
+                return
+            for connection in wait(connections):
+                try:
+                    kind, key, payload = connection.recv()
+                except (EOFError, OSError):
+                    self._worker_exited(connection)
+                    continue
+                with self.lock:
+                    self.assigned.pop(connection, None)
+                    if not self.closed:
+                        self.idle.append(connection)
+                        self._dispatch()
+                self._resolve(kind, key, payload)
+
+    def _resolve(self, kind, key, payload):
+        with self.lock:
+            future = self.pending.pop(key, None)
+        if kind == "audio":
+            # Always copy it out, even if nobody is waiting anymore, so the shared memory block gets freed
+            audio = self._receive_audio(*payload)
+            if future is not None:
+                future.set_result(audio)
+        elif future is not None:
+            if kind == "error":
+                future.set_exception(TTSServiceError(payload))
+            else:
+                future.set_result(payload)
+
+    @staticmethod
+    def _receive_audio(name, shape, sample_rate):
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            samples = np.ndarray(shape, dtype=np.float32, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+        return AudioBuffer(samples, sample_rate)
+
+    def _worker_exited(self, connection):
+        # A worker that crashed (e.g. out of memory) is replaced, and the request it was working on fails instead of hanging forever
+        with self.lock:
+            worker = self.workers.pop(connection)
+            request_id = self.assigned.pop(connection, None)
+            if connection in self.idle:
+                self.idle.remove(connection)
+        connection.close()
+        worker.join(timeout=5)
+        if request_id is not None:
+            self._fail([request_id], f"TTS worker {worker.pid} exited with code {worker.exitcode}")
+        if self.closed:
+            return
+        print(f"[red]TTS worker {worker.pid} exited with code {worker.exitcode}, starting a new one.")
+        self._start_worker()
+
+    def _fail(self, request_ids, reason):
+        for request_id in request_ids:
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_exception(TTSServiceError(reason))
@@ -0,0 +1,60 @@
+# TurnScheduler: Decides who talks next, and wakes them up the instant it's their turn
+# Agents block in wait_for_turn() until someone requests a turn for them, so handoffs are immediate and idle threads use no CPU.
+# Pausing and resuming the conversation, and activating a specific agent, all go through the scheduler too.
+import threading
+from collections import deque
+from rich import print
+
+class TurnScheduler:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.requests = deque()  # agents waiting to start their turn, oldest first
+        self.paused = False
+        self.closed = False
+
+    def request_turn(self, agent, force=False):
+        """
+        Queues a turn for this agent and wakes it up. Returns False if the request was ignored.
+        Agent-to-agent handoffs are ignored while the conversation is paused, unless force is set.
+        """
+        with self.condition:
+            if self.closed or (self.paused and not force):
+                return False
+            if agent not in self.requests:
+                self.requests.append(agent)
+            self.condition.notify_all()
+            return True
+
+    def activate(self, agent):
+        # Used by the human to pick who talks next. This also unpauses the conversation.
+        with self.condition:
+            self.paused = False
+        return self.request_turn(agent, force=True)
+
+    def wait_for_turn(self, agent):
+        # Blocks until this agent has a turn queued. Returns False if the scheduler was shut down instead.
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or agent in self.requests)
+            if self.closed:
+                return False
+            self.requests.remove(agent)
+            return True
+
+    def pause(self):
+        # Stops agents from handing the conversation to each other. Agents that already have a turn queued still talk.
+        with self.condition:
+            if not self.paused:
+                print("[italic red] Agents have been paused")
+            self.paused = True
+
+    def resume(self):
+        with self.condition:
+            self.paused = False
+
+    def shutdown(self):
+        # Wakes every waiting agent so their threads can exit
+        with self.condition:
+            self.closed = True
+            self.requests.clear()
+            self.condition.notify_all()
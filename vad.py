@@ -0,0 +1,133 @@
+# VoiceActivityDetector: Finds the parts of a mic recording that have speech in them, in NumPy
+# Every 20 ms frame gets two features, computed for all frames at once:
+#   energy: loudness in dB, compared against the noise floor of the recording (speech is well above it)
+#   spectral flatness: geometric / arithmetic mean of the power spectrum in the speech band. Hiss and fan noise are flat (close to 1),
+#                      voices have harmonics and formants, so they're peaky (close to 0). This keeps loud steady noise from counting as speech.
+# Used to trim the silence before and after an utterance (so Whisper has less audio to chew through),
+# and by SpeechEndpointer to notice when the human has stopped talking, for hands-free recording.
+import numpy as np
+
+class VoiceActivityDetector:
+    """
+    Parameters:
+    sample_rate (int): rate of the samples that will be passed in
+    frame_ms (int): length of each analysis frame
+    energy_threshold_db (float): how far above the noise floor a frame has to be to count as speech
+    flatness_threshold (float): frames flatter than this are noise, however loud they are
+    min_energy_db (float): frames quieter than this are never speech, so a silent room with a very low noise floor doesn't trigger on breathing
+    hangover_ms (int): gaps in speech shorter than this (pauses between words) still count as speech
+    """
+
+    def __init__(self, sample_rate, frame_ms=20, energy_threshold_db=12.0, flatness_threshold=0.45, min_energy_db=-55.0, hangover_ms=300):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.energy_threshold_db = energy_threshold_db
+        self.flatness_threshold = flatness_threshold
+        self.min_energy_db = min_energy_db
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+        self.window = np.hanning(self.frame_length).astype(np.float32)
+        frequencies = np.fft.rfftfreq(self.frame_length, 1 / sample_rate)
+        self.speech_band = (frequencies >= 100) & (frequencies <= 4000)
+
+    @property
+    def frame_seconds(self):
+        return self.frame_length / self.sample_rate
+
+    def frame_features(self, samples):
+        # Returns (energy in dB, spectral flatness) for every whole frame in samples (float, mono)
+        frame_count = len(samples) // self.frame_length
+        frames = np.asarray(samples[:frame_count * self.frame_length], dtype=np.float32).reshape(frame_count, self.frame_length)
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1))[:, self.speech_band] ** 2 + 1e-12
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        return energy_db, flatness
+
+    def speech_mask(self, samples, noise_floor_db=None):
+        # One bool per frame. Without a noise floor, it's estimated from the quietest frames of the recording.
+        energy_db, flatness = self.frame_features(samples)
+        if len(energy_db) == 0:
+            return np.zeros(0, dtype=bool)
+        if noise_floor_db is None:
+            noise_floor_db = np.percentile(energy_db, 10)
+        speech = ((energy_db > noise_floor_db + self.energy_threshold_db) & (energy_db > self.min_energy_db)
+                  & (flatness < self.flatness_threshold))
+        return self._fill_gaps(speech)
+
+    def speech_bounds(self, samples, padding_ms=200):
+        # Returns (start, end) sample indices around all the speech in samples, or None if there isn't any
+        speech = self.speech_mask(samples)
+        frames = np.flatnonzero(speech)
+        if len(frames) == 0:
+            return None
+        padding = int(self.sample_rate * padding_ms / 1000)
+        start = max(0, frames[0] * self.frame_length - padding)
+        end = min(len(samples), (frames[-1] + 1) * self.frame_length + padding)
+        return start, end
+
+    def _fill_gaps(self, speech):
+        # Marks short runs of non-speech between two speech frames as speech
+        index = np.arange(len(speech))
+        previous_speech = np.maximum.accumulate(np.where(speech, index, -1))
+        next_speech = np.minimum.accumulate(np.where(speech, index, len(speech))[::-1])[::-1]
+        gap = (previous_speech >= 0) & (next_speech < len(speech)) & (next_speech - previous_speech <= self.hangover_frames)
+        return speech | gap
+
+
+class SpeechEndpointer:
+    """
+    Follows a recording as it comes in and notices when the speaker has started and then stopped talking.
+    Parameters:
+    vad (VoiceActivityDetector)
+    silence_s (float): this much silence after speech ends the utterance
+    min_speech_s (float): speech shorter than this (a cough, a click) doesn't start an utterance
+    """
+
+    def __init__(self, vad, silence_s=1.0, min_speech_s=0.25):
+        self.vad = vad
+        self.silence_frames = int(silence_s / vad.frame_seconds)
+        self.min_speech_frames = max(1, int(min_speech_s / vad.frame_seconds))
+        self.remainder = np.zeros(0, dtype=np.float32)  # Samples that didn't fill a whole frame yet
+        self.noise_floor_db = None
+        self.speech_run = 0  # Speech frames in a row
+        self.silence_run = 0  # Non-speech frames in a row since speech started
+        self.speech_started = False
+        self.ended = False
+        self.frames_seen = 0
+        self.speech_start_frame = None
+
+    def feed(self, samples):
+        # samples: float mono. Returns True once the utterance has ended.
+        samples = np.concatenate([self.remainder, samples])
+        energy_db, flatness = self.vad.frame_features(samples)
+        self.remainder = samples[len(energy_db) * self.vad.frame_length:]
+        for energy, frame_flatness in zip(energy_db, flatness):
+            self._feed_frame(energy, frame_flatness)
+        return self.ended
+
+    @property
+    def speech_start_seconds(self):
+        # When speech started (in seconds since the first sample fed), or None
+        if self.speech_start_frame is None:
+            return None
+        return self.speech_start_frame * self.vad.frame_seconds
+
+    def _feed_frame(self, energy, flatness):
+        # The noise floor follows the quietest frames, and creeps up slowly (about 1 dB/s) in case the room gets louder
+        if self.noise_floor_db is None:
+            self.noise_floor_db = energy
+        self.noise_floor_db = min(energy, self.noise_floor_db + self.vad.frame_seconds)
+        speech = (energy > self.noise_floor_db + self.vad.energy_threshold_db and energy > self.vad.min_energy_db
+                  and flatness < self.vad.flatness_threshold)
+        self.frames_seen += 1
+        if speech:
+            self.speech_run += 1
+            self.silence_run = 0
+            if not self.speech_started and self.speech_run >= self.min_speech_frames:
+                self.speech_started = True
+                self.speech_start_frame = self.frames_seen - self.speech_run
+        else:
+            self.speech_run = 0
+            if self.speech_started:
+                self.silence_run += 1
+                if self.silence_run >= self.silence_frames:
+                    self.ended = True
@@ -1,4 +1,6 @@
+import os
 import torch
+import numpy as np
 from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 from rich import print
 import time
@@ -8,20 +10,44 @@ class WhisperManager():
     # Uses Whisper on HuggingFace: https://huggingface.co/openai/whisper-large-v3
     # Need to make sure you've installed torch with CUDA support, rather than just default torch: pip install torch torchvision torchaudio --index-url https://download.pytorch.org/whl/cu118
     # I tried a lot but could not get Flash Attention 2 to install. It would speed up performance but isn't necessary.
+    # Without a GPU, large-v3 is far too slow for a live conversation. On CPU a smaller model (e.g. "base.en" or "small.en")
+    # with its linear layers quantized to int8 transcribes many times faster than real time.
 
-    def __init__(self):
-        print(torch.cuda.is_available())  # Should return True if CUDA is available
-        print(torch.cuda.get_device_name(0))  # Should return the name of your GPU, e.g., "NVIDIA GeForce RTX 4070 Ti"
-        device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-        model_id = "openai/whisper-large-v3"
+    """
+    Parameters:
+    model_size (str): "tiny", "base", "small", "medium", "large-v3", their English-only ".en" versions (e.g. "small.en"),
+                      or a full HuggingFace model id. None = "large-v3" on a GPU, "small.en" on CPU.
+    device (str): "cuda:0", "cpu", or None to use the GPU if there is one
+    quantize (bool): dynamically quantize the linear layers to int8 (CPU only). None = on for CPU.
+    num_threads (int): torch CPU threads. None = one per physical core (about half of os.cpu_count()), which is usually faster than torch's default.
+    warm_up (bool): transcribe a second of silence at load time, so the first real transcription doesn't pay for the one-time setup
+    """
+
+    def __init__(self, model_size=None, device=None, quantize=None, num_threads=None, warm_up=True):
+        cuda = torch.cuda.is_available()
+        device = device or ("cuda:0" if cuda else "cpu")
+        on_gpu = device.startswith("cuda")
+        if on_gpu:
+            print(f"[green]Whisper is using {torch.cuda.get_device_name(device)}")  # e.g. "NVIDIA GeForce RTX 4070 Ti"
+        else:
+            torch.set_num_threads(num_threads or max(1, (os.cpu_count() or 2) // 2))
+        model_size = model_size or ("large-v3" if on_gpu else "small.en")
+        model_id = model_size if "/" in model_size else f"openai/whisper-{model_size}"
+        torch_dtype = torch.float16 if on_gpu else torch.float32
+        if quantize is None:
+            quantize = not on_gpu
 
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
             model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
         )
         model.to(device)
-        model.generation_config.is_multilingual = False
-        model.generation_config.language = "en"
+        if not model_id.endswith(".en"):
+            # English-only models already are, and refuse a language setting
+            model.generation_config.is_multilingual = False
+            model.generation_config.language = "en"
+        if quantize and not on_gpu:
+            # int8 weights for every Linear layer, activations are quantized on the fly. Most of Whisper's time on CPU is in these layers.
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
 
         processor = AutoProcessor.from_pretrained(model_id)
 
@@ -37,19 +63,69 @@ class WhisperManager():
             torch_dtype=torch_dtype,
             device=device,
         )
-    
+        # Shown in report()
+        self.description = f"{model_id} on {device}" + (", int8" if quantize and not on_gpu else "") + \
+                           (f", {torch.get_num_threads()} threads" if not on_gpu else "")
+        self.audio_seconds = 0.0
+        self.processing_seconds = 0.0
+        self.transcriptions = 0
+        if warm_up:
+            self._run(np.zeros(16000, dtype=np.float32), 16000, return_timestamps=False)
+            # The warm-up isn't counted in the real-time factor
+            self.audio_seconds = self.processing_seconds = 0.0
+            self.transcriptions = 0
+
     # Converts an audio file into transcribed text. Can provide also provide timestamps
     # wav and mp3 files appear to take the same amount of time to process
     # With test files, word timestamps took 3.5-4 seconds, sentence timestamps took 2.2 seconds, no timestamps took 1.9-2 seconds
-    def audio_to_text(self, audio_file, timestamps=None):
+    # audio_file can also be a NumPy array of mono float32 samples at sample_rate (e.g. from AudioManager.record_audio(as_array=True)),
+    # which skips writing, reading and decoding a file
+    def audio_to_text(self, audio_file, timestamps=None, sample_rate=16000):
         if timestamps == None:
-            result = self.pipe(audio_file, return_timestamps=False)
+            result = self._run(audio_file, sample_rate, return_timestamps=False)
         elif timestamps == "sentence":
-            result = self.pipe(audio_file, return_timestamps=True)
+            result = self._run(audio_file, sample_rate, return_timestamps=True)
         elif timestamps == "word":
-            result = self.pipe(audio_file, return_timestamps="word")
+            result = self._run(audio_file, sample_rate, return_timestamps="word")
         else:
             result = {"text": " "}
+        return self._format_result(result, timestamps)
+
+    # Transcribes many clips in one pass: the pipeline runs their 30 second chunks through the model batch_size at a time,
+    # instead of one clip per call. clips is any iterable (it's read lazily) of file paths or (samples, sample_rate) tuples.
+    # Yields each clip's result in the same order, formatted like audio_to_text's, as soon as it's done.
+    def transcribe_batch(self, clips, timestamps=None, batch_size=16):
+        return_timestamps = {None: False, "sentence": True, "word": "word"}[timestamps]
+        durations = []  # Filled in as the pipeline pulls clips, read back in the same order
+
+        def inputs():
+            for clip in clips:
+                if isinstance(clip, tuple):
+                    samples, sample_rate = clip
+                    durations.append(len(samples) / sample_rate)
+                    yield {"raw": np.asarray(samples, dtype=np.float32), "sampling_rate": sample_rate}
+                else:
+                    durations.append(self._file_duration(clip))
+                    yield clip
+
+        results = iter(self.pipe(inputs(), batch_size=batch_size, return_timestamps=return_timestamps))
+        index = 0
+        while True:
+            # The pipeline only runs the model when the next result is asked for
+            start = time.perf_counter()
+            try:
+                with torch.inference_mode():
+                    result = next(results)
+            except StopIteration:
+                break
+            self.processing_seconds += time.perf_counter() - start
+            self.audio_seconds += durations[index]
+            self.transcriptions += 1
+            index += 1
+            yield self._format_result(result, timestamps)
+
+    @staticmethod
+    def _format_result(result, timestamps):
         if timestamps == None:
             # If they didn't want the timestamps, then just return the text
             return result["text"]
@@ -67,3 +143,46 @@ class WhisperManager():
                 timestamped_chunks.append(new_chunk)
             return timestamped_chunks
 
+    # Transcribes samples that are already in memory (float32, mono) and returns a list of (word, start_time, end_time)
+    # Used by StreamingTranscriber (streaming_asr.py), which transcribes the mic over and over while it's still recording
+    def transcribe_words(self, samples, sample_rate=16000):
+        result = self._run(samples, sample_rate, return_timestamps="word")
+        words = []
+        for chunk in result["chunks"]:
+            start_time, end_time = chunk["timestamp"]
+            # The last word can come back without an end time
+            words.append((chunk["text"], start_time, end_time if end_time is not None else start_time))
+        return words
+
+    @property
+    def real_time_factor(self):
+        # Seconds spent transcribing per second of audio. Under 1 is faster than real time.
+        return self.processing_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+    def report(self):
+        return (f"Whisper ({self.description}): {self.transcriptions} transcriptions, {self.audio_seconds:.1f}s of audio "
+                f"in {self.processing_seconds:.1f}s, real-time factor {self.real_time_factor:.2f}")
+
+    def _run(self, audio, sample_rate, **kwargs):
+        # Every transcription goes through here, so it's timed for the real-time factor
+        if isinstance(audio, np.ndarray):
+            # The pipeline resamples arrays itself if sample_rate isn't what the model expects (16 kHz)
+            duration = len(audio) / sample_rate
+            audio = {"raw": np.asarray(audio, dtype=np.float32), "sampling_rate": sample_rate}
+        else:
+            duration = self._file_duration(audio)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            result = self.pipe(audio, **kwargs)
+        self.processing_seconds += time.perf_counter() - start
+        self.audio_seconds += duration
+        self.transcriptions += 1
+        return result
+
+    @staticmethod
+    def _file_duration(file_path):
+        try:
+            import soundfile as sf
+            return sf.info(file_path).duration
+        except Exception:
+            return 0.0